@@ -8,8 +8,12 @@ from pykern.api import util
 from pykern.pkcollections import PKDict
 from pykern.pkdebug import pkdc, pkdlog, pkdp, pkdexc
 import asyncio
+import pykern.pkasyncio
 import pykern.util
+import random
+import socket
 import tornado.httpclient
+import tornado.netutil
 import tornado.websocket
 
 
@@ -20,27 +24,61 @@ class Client:
 
     `http_config.request_config` is deprecated.
 
+    If ``http_config.reconnect_secs`` is set, a lost connection is
+    reconnected with exponential backoff (up to
+    ``http_config.reconnect_max_secs``) and authenticated with the
+    original ``auth_args``. Active subscriptions are subscribed again
+    with their original ``api_args`` so the server starts them over.
+    Pending calls fail with `util.APIDisconnected` unless they were
+    made with ``idempotent``, in which case they are sent again. Calls
+    made while reconnecting wait for the connection. See `stats`.
+
+    If ``http_config.unix_socket`` is set, the client connects to that
+    Unix domain socket path instead of ``tcp_ip`` and ``tcp_port``.
+
     Args:
-        http_config (PKDict): tcp_ip, tcp_port, api_uri
+        http_config (PKDict): tcp_ip, tcp_port, unix_socket, api_uri, compression_level, compression_min_size, reconnect_secs, reconnect_max_secs
     """
 
     def __init__(self, http_config):
-        # TODO(robnagler) tls with verification(?)
-        self.uri = (
-            f"ws://{http_config.tcp_ip}:{http_config.tcp_port}{http_config.api_uri}"
-        )
+        self.uri = uri(http_config)
         self._authenticated = False
+        c = http_config.copy().pksetdefault(**util.COMPRESSION_DEFAULTS)
+        self._compression_options = util.compression_options(c)
+        self._compression_min_size = c.compression_min_size
+        self._reconnect_secs = c.get("reconnect_secs")
+        self._reconnect_max_secs = c.get("reconnect_max_secs", 30)
+        self._reconnect_task = None
+        self._resolver = (
+            _UnixResolver(path=str(u)) if (u := c.get("unix_socket")) else None
+        )
+        self._auth_args = None
+        self._connected = asyncio.Event()
+        self._stats = PKDict(
+            connects=0,
+            disconnects=0,
+            reconnect_failures=0,
+            resubscribes=0,
+            retries=0,
+        )
         self._connection = None
         self._destroyed = False
         self._next_call_id = 1
+        self._packer = util.msg_packer()
         self._pending_calls = PKDict()
 
-    async def call_api(self, api_name, api_args):
+    async def call_api(self, api_name, api_args, idempotent=False, timeout=None):
         """Make a request to the API server
 
+        With `timeout`, the server cancels the call if it does not
+        complete in time (see `pykern.api.server.Deadline`) and the
+        call raises an error containing ``APITimeout``.
+
         Args:
             api_name (str): what to call on the server
             api_args (PKDict): passed verbatim to the API on the server.
+            idempotent (bool): may be sent again after a reconnect [False]
+            timeout (float): seconds from when the server receives the call [None: no limit]
         Returns:
             PKDict: value of `api_result`.
         Raises:
@@ -48,7 +86,64 @@ class Client:
            Exception: other exceptions that `AsyncHTTPClient.fetch` may raise, e.g. NotFound
         """
 
-        return await self._send_api(api_name, api_args, util.MsgKind.CALL).result_get()
+        x = _timeout_extra(timeout)
+        if idempotent:
+            x.idempotent = True
+        await self._reconnect_wait(api_name)
+        return await self._send_api(
+            api_name, api_args, util.MsgKind.CALL, x
+        ).result_get()
+
+    async def call_api_batch(
+        self, calls, stream=False, return_exceptions=False, timeout=None
+    ):
+        """Make several requests to the API server in a single message
+
+        The server runs the calls concurrently. Replies are returned
+        in a single message unless `stream`, in which case the server
+        sends each reply as soon as its call completes.
+
+        Args:
+            calls (iterable): (api_name, api_args) pairs
+            stream (bool): server replies to each call as it completes [False]
+            return_exceptions (bool): exceptions are returned in place of results, see `asyncio.gather` [False]
+            timeout (float): applies to each call, see `call_api` [None: no limit]
+        Returns:
+            list: value of `api_result` for each call in order of `calls`
+        Raises:
+           pykern.util.APIError: if there was an raise in the API or on a server protocol violation
+        """
+
+        t = _timeout_extra(timeout)
+        await self._reconnect_wait(None)
+        self._assert_can_send(None)
+        c = list(calls)
+        if not c:
+            raise AssertionError("calls must not be empty")
+        for x in c:
+            # validate before any _Call is registered so none leak
+            if not (
+                isinstance(x, (list, tuple)) and len(x) == 2 and isinstance(x[0], str)
+            ):
+                raise AssertionError(f"call={x} must be (api_name, api_args)")
+        c = [self._new_call(n, a, util.MsgKind.CALL, t) for n, a in c]
+        try:
+            self._send_msg(
+                PKDict(
+                    calls=[x.msg for x in c],
+                    call_id=self._new_call_id(),
+                    msg_kind=util.MsgKind.BATCH,
+                    stream=stream,
+                ),
+            )
+        except Exception:
+            for x in c:
+                self.remove_call(x.msg.call_id)
+            raise
+        return await asyncio.gather(
+            *(x.call.result_get() for x in c),
+            return_exceptions=return_exceptions,
+        )
 
     async def connect(self, auth_args=None):
         """Connect to the server
@@ -59,9 +154,9 @@ class Client:
             Client: self
         """
 
-        async def _auth():
+        async def _authenticate():
             try:
-                await self.call_api(util.AUTH_API_NAME, _auth_args())
+                await self._auth()
                 return True
             except Exception as e:
                 if self._destroyed:
@@ -69,31 +164,26 @@ class Client:
                 self.destroy()
                 raise
 
-        def _auth_args():
-            rv = auth_args
-            if rv is None:
-                rv = PKDict()
-            return rv.pksetdefault(token=None, version=util.AUTH_API_VERSION)
-
         if self._destroyed:
             raise AssertionError("destroyed")
         if self._connection:
             raise AssertionError("already connected")
-        self._connection = await tornado.websocket.websocket_connect(
-            tornado.httpclient.HTTPRequest(self.uri, method="GET"),
-            # TODO(robnagler) accept in http_config. share defaults with sirepo.job.
-            max_message_size=int(2e8),
-            ping_interval=120,
-            ping_timeout=240,
-        )
-        asyncio.create_task(self._read_loop())
-        self._authenticated = await _auth()
+        self._auth_args = auth_args
+        await self._ws_connect()
+        self._authenticated = await _authenticate()
+        if self._authenticated:
+            self._connected.set()
         return self
 
     def destroy(self):
         """Must be called"""
         if self._destroyed:
             return
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        # wake calls waiting for a reconnect
+        self._connected.set()
         # Allow functions to call back so _destroyed is still True.
         # Reversed so we unsubscribe in opposite order of subscribe
         for c in reversed(list(self._pending_calls.values())):
@@ -108,13 +198,62 @@ class Client:
             self._connection.close()
             self._connection = None
 
+    def is_connected(self):
+        """Authenticated and not reconnecting
+
+        Returns:
+            bool: True if calls will be sent immediately
+        """
+        return (
+            not self._destroyed
+            and self._authenticated
+            and self._reconnect_task is None
+            and self._connection is not None
+        )
+
+    def is_destroyed(self):
+        return self._destroyed
+
+    def reconnect(self, auth_args=None):
+        """Not a public interface
+
+        Reconnect in the background after `connect` failed as if the
+        connection were lost. Requires ``reconnect_secs``.
+        """
+        if self._destroyed or self._reconnect_task or self._authenticated:
+            return
+        if self._reconnect_secs is None:
+            raise AssertionError("reconnect_secs not configured")
+        self._auth_args = auth_args
+        if c := self._connection:
+            self._connection = None
+            c.close()
+        self._connected.clear()
+        self._reconnect_task = pykern.pkasyncio.create_task(self._reconnect())
+
+    def stats(self):
+        """Connection churn for monitoring
+
+        Returns:
+            PKDict: connects, disconnects, reconnect_failures, resubscribes, retries
+        """
+        return self._stats.copy()
+
     def remove_call(self, call_id):
         """Not a public interface"""
         if self._destroyed:
             return
         return self._pending_calls.pkdel(call_id)
 
-    async def subscribe_api(self, api_name, api_args):
+    def credit_call(self, call_id, credits):
+        """Not a public interface"""
+        if self._destroyed or call_id not in self._pending_calls:
+            return
+        self._send_msg(
+            PKDict(call_id=call_id, credits=credits, msg_kind=util.MsgKind.CREDIT)
+        )
+
+    async def subscribe_api(self, api_name, api_args, credits=None, timeout=None):
         """Subscribe to api_name from API server
 
         Maybe used in ``with``::
@@ -130,14 +269,28 @@ class Client:
             ... process r and possibly more calls to result_get ...
             s.unsubscribe()
 
+        With `credits`, the server sends at most `credits` results
+        which have not been returned by `_Call.result_get`. Credits are
+        returned to the server as results are consumed. What the
+        server does when there are no credits depends on the api (see
+        `pykern.api.util.subscription`).
+
         Args:
             api_name (str): what to call on the server
             api_args (PKDict): passed verbatim to the API on the server.
+            credits (int): maximum outstanding results [None: unlimited]
+            timeout (float): subscription ends in error after seconds, see `call_api` [None: no limit]
         Returns:
             _Call: to get replies or unsubscribe
         """
 
-        return self._send_api(api_name, api_args, util.MsgKind.SUBSCRIBE)
+        x = _timeout_extra(timeout)
+        if credits is not None:
+            if not isinstance(credits, int) or credits <= 0:
+                raise AssertionError(f"credits={credits} must be a positive int")
+            x.credits = credits
+        await self._reconnect_wait(api_name)
+        return self._send_api(api_name, api_args, util.MsgKind.SUBSCRIBE, x)
 
     def unsubscribe_call(self, call_id):
         """Not a public interface"""
@@ -156,11 +309,58 @@ class Client:
         self.destroy()
         return False
 
-    async def _read_loop(self):
+    async def _auth(self):
+        a = PKDict() if self._auth_args is None else self._auth_args.copy()
+        await self._send_api(
+            util.AUTH_API_NAME,
+            a.pksetdefault(token=None, version=util.AUTH_API_VERSION),
+            util.MsgKind.CALL,
+        ).result_get()
+
+    def _connection_lost(self, connection):
+        def _calls_destroy():
+            for c in list(self._pending_calls.values()):
+                if not (c.is_subscription or c.is_idempotent):
+                    c.destroy()
+
+        if self._destroyed or connection is not self._connection:
+            return
+        if self._reconnect_task:
+            # lost while authenticating so _reconnect tries again
+            _calls_destroy()
+            return
+        if self._reconnect_secs is None or not self._authenticated:
+            self.destroy()
+            return
+        self._stats.disconnects += 1
+        self._authenticated = False
+        self._connected.clear()
+        self._connection = None
+        connection.close()
+        _calls_destroy()
+        pkdlog("disconnected, reconnecting {}", self)
+        self._reconnect_task = pykern.pkasyncio.create_task(self._reconnect())
+
+    async def _read_loop(self, connection):
+        def _batch_error(replies):
+            if not isinstance(replies, list):
+                return f"batch replies type={type(replies)}"
+            for x in replies:
+                if not isinstance(x, PKDict):
+                    return f"batch reply type={type(x)}"
+                if (i := x.get("call_id")).__class__ is not int or i <= 0:
+                    return f"batch reply call_id={i} invalid"
+                if x.get("msg_kind") != util.MsgKind.REPLY.value:
+                    return f"batch reply msg_kind={x.get('msg_kind')} invalid"
+                x.msg_kind = util.MsgKind.REPLY
+            return None
+
         def _unpack(msg):
             if msg is None:
                 return None
             r, e = util.msg_unpack(msg, "client")
+            if not e and r.msg_kind.is_batch():
+                e = _batch_error(r.get("replies"))
             if e:
                 pkdlog("msg_unpack error={} {}", e, self)
                 return None
@@ -170,25 +370,22 @@ class Client:
         try:
             if self._destroyed:
                 return
-            while m := await self._connection.read_message():
+            while m := await connection.read_message():
                 if self._destroyed:
                     return
                 if not (r := _unpack(m)):
                     break
-                if not (c := self._pending_calls.get(r.call_id)):
-                    pkdlog("call_id={} not found {}", r.call_id, self)
-                    # May happen on subscriptions
-                    continue
-                c.reply_put(r)
-                if not c.is_subscription or r.msg_kind.is_unsubscribe():
-                    # Call is no longer valid for messages
-                    self.remove_call(r.call_id)
+                if r.msg_kind.is_batch():
+                    for x in r.replies:
+                        self._reply_put(x)
+                else:
+                    self._reply_put(r)
                 # Clear all state before next await
-                c = m = r = None
+                m = r = x = None
         except Exception as e:
             pkdlog("exception={} reply={} stack={}", e, r, pkdexc())
         try:
-            self.destroy()
+            self._connection_lost(connection)
         except Exception as e:
             pkdlog("exception={} stack={}", e, pkdexc())
 
@@ -202,20 +399,7 @@ class Client:
             return f"<{self.__class__.__name__} DESTROYED>"
         return f"<{self.__class__.__name__}{_calls()}>"
 
-    def _send_api(self, api_name, api_args, msg_kind):
-        def _send():
-            c = PKDict(
-                api_name=api_name,
-                api_args=api_args,
-                call_id=self._next_call_id,
-                msg_kind=msg_kind,
-            )
-            self._next_call_id += 1
-            rv = _Call(self, c)
-            self._pending_calls[c.call_id] = rv
-            self._send_msg(c)
-            return rv
-
+    def _assert_can_send(self, api_name):
         if self._destroyed:
             raise util.APIDisconnected()
         if self._connection is None:
@@ -224,10 +408,115 @@ class Client:
             raise AssertionError(
                 "connection not authenticated; wait for connect() to return"
             )
-        return _send()
+
+    async def _reconnect(self):
+        d = self._reconnect_secs
+        try:
+            while not self._destroyed:
+                # jitter avoids all clients reconnecting at once
+                await asyncio.sleep(d * random.uniform(0.5, 1))
+                try:
+                    await self._ws_connect()
+                    await self._auth()
+                    break
+                except Exception as e:
+                    if self._destroyed:
+                        return
+                    pkdlog("reconnect exception={} {}", e, self)
+                    self._stats.reconnect_failures += 1
+                    if c := self._connection:
+                        self._connection = None
+                        c.close()
+                    d = min(d * 2, self._reconnect_max_secs)
+            else:
+                return
+            self._authenticated = True
+            for c in list(self._pending_calls.values()):
+                if c.is_subscription:
+                    self._stats.resubscribes += 1
+                else:
+                    self._stats.retries += 1
+                self._send_msg(c.resend_msg())
+            self._connected.set()
+            pkdlog("reconnected {}", self)
+        finally:
+            self._reconnect_task = None
+
+    async def _reconnect_wait(self, api_name):
+        if self._reconnect_task and api_name != util.AUTH_API_NAME:
+            await self._connected.wait()
+
+    def _new_call(self, api_name, api_args, msg_kind, extra=None):
+        m = PKDict(
+            api_name=api_name,
+            api_args=api_args,
+            call_id=self._new_call_id(),
+            msg_kind=msg_kind,
+        )
+        if extra:
+            m.pkupdate(extra)
+        rv = _Call(self, m)
+        self._pending_calls[m.call_id] = rv
+        return PKDict(call=rv, msg=m)
+
+    def _new_call_id(self):
+        rv = self._next_call_id
+        self._next_call_id += 1
+        return rv
+
+    def _reply_put(self, msg):
+        if not (c := self._pending_calls.get(msg.call_id)):
+            pkdlog("call_id={} not found {}", msg.call_id, self)
+            # May happen on subscriptions
+            return
+        c.reply_put(msg)
+        if not c.is_subscription or msg.msg_kind.is_unsubscribe():
+            # Call is no longer valid for messages
+            self.remove_call(msg.call_id)
+
+    def _send_api(self, api_name, api_args, msg_kind, extra=None):
+        self._assert_can_send(api_name)
+        rv = self._new_call(api_name, api_args, msg_kind, extra)
+        self._send_msg(rv.msg)
+        return rv.call
+
+    async def _ws_connect(self):
+        self._connection = await tornado.websocket.websocket_connect(
+            tornado.httpclient.HTTPRequest(self.uri, method="GET"),
+            compression_options=self._compression_options,
+            resolver=self._resolver,
+            # TODO(robnagler) accept in http_config. share defaults with sirepo.job.
+            max_message_size=int(2e8),
+            ping_interval=120,
+            ping_timeout=240,
+        )
+        self._stats.connects += 1
+        asyncio.create_task(self._read_loop(self._connection))
 
     def _send_msg(self, msg):
-        self._connection.write_message(util.msg_pack(msg), binary=True)
+        if self._connection is None:
+            # lost connection; resent or discarded on reconnect
+            return
+        util.ws_write(
+            self._connection.protocol,
+            util.msg_pack(msg, self._packer),
+            self._compression_min_size,
+        )
+
+
+def uri(http_config):
+    """Websocket URI of server
+
+    Args:
+        http_config (PKDict): tcp_ip, tcp_port, api_uri, unix_socket
+    Returns:
+        str: URI
+    """
+    if http_config.get("unix_socket"):
+        # host is only used for the Host header
+        return f"ws://localhost{http_config.api_uri}"
+    # TODO(robnagler) tls with verification(?)
+    return f"ws://{http_config.tcp_ip}:{http_config.tcp_port}{http_config.api_uri}"
 
 
 class _Call:
@@ -241,9 +530,13 @@ class _Call:
     def __init__(self, client, msg):
         self.api_name = msg.api_name
         self.is_subscription = msg.msg_kind.is_subscribe()
+        self.is_idempotent = msg.pkdel("idempotent") or False
         self._call_id = msg.call_id
         self._client = client
-        # TODO(robnagler) should there be a maximum?
+        # Bounded by server when credits
+        self._credits = msg.get("credits")
+        self._consumed = 0
+        self._msg = msg
         self._reply_q = asyncio.Queue()
         self._destroyed = False
 
@@ -258,6 +551,7 @@ class _Call:
             # Inferior to shutdown, but necessary pre-Python 3.13
             self._reply_q.put_nowait(None)
         self._client = None
+        self._msg = None
         self._reply_q = None
 
     def reply_put(self, msg):
@@ -265,6 +559,12 @@ class _Call:
             return
         self._reply_q.put_nowait(msg)
 
+    def resend_msg(self):
+        """Message to send after reconnect, not public"""
+        # server grants initial credits again
+        self._consumed = 0
+        return self._msg
+
     async def result_get(self):
         """Get the next result from a subscription.
 
@@ -292,7 +592,8 @@ class _Call:
                 return None
             if rv.api_error:
                 raise pykern.util.APIError(rv.api_error)
-            d = not self.is_subscription
+            if not (d := not self.is_subscription) and self._credits:
+                self._credit()
             return rv.api_result
         finally:
             if d:
@@ -327,3 +628,32 @@ class _Call:
             return " DESTROYED" if self._destroyed else ""
 
         return f"<{self.__class__.__name__} {self.api_name}#{self._call_id}{_d()}>"
+
+    def _credit(self):
+        self._consumed += 1
+        # half the window amortizes messages without starving the server
+        if self._consumed * 2 >= self._credits:
+            self._client.credit_call(self._call_id, self._consumed)
+            self._consumed = 0
+
+
+class _UnixResolver(tornado.netutil.Resolver):
+    """Resolves all hosts to a Unix domain socket path"""
+
+    def initialize(self, path):
+        self._path = path
+
+    async def resolve(self, host, port, family=socket.AF_UNSPEC):
+        return [(socket.AF_UNIX, self._path)]
+
+
+def _timeout_extra(timeout):
+    if timeout is None:
+        return PKDict()
+    if (
+        isinstance(timeout, bool)
+        or not isinstance(timeout, (int, float))
+        or timeout <= 0
+    ):
+        raise AssertionError(f"timeout={timeout} must be a positive number")
+    return PKDict(timeout=timeout)
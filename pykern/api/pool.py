@@ -0,0 +1,175 @@
+"""Pool of WebSocket Quest clients
+
+:copyright: Copyright (c) 2026 RadiaSoft LLC.  All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+from pykern.api import client, util
+from pykern.pkcollections import PKDict
+from pykern.pkdebug import pkdc, pkdlog, pkdp, pkdexc
+import asyncio
+
+
+class Pool:
+    """Authenticated connections to one or more servers
+
+    Calls are sent on the connection with the fewest outstanding calls
+    so a slow call does not block calls on other connections. Lost
+    connections are reconnected in the background by the clients (see
+    ``reconnect_secs`` in `client.Client`) while calls use the
+    remaining connections.
+
+    Maybe called as an async context manager.
+
+    Args:
+        http_configs (Iterable): `client.Client` args, one per server
+        connections (int): connections per server [1]
+        auth_args (PKDict): passed to `client.Client.connect` [None]
+        reconnect_secs (float): first delay before reconnecting [0.5]
+        reconnect_max_secs (float): maximum delay before reconnecting [30]
+    """
+
+    def __init__(
+        self,
+        http_configs,
+        connections=1,
+        auth_args=None,
+        reconnect_secs=0.5,
+        reconnect_max_secs=30,
+    ):
+        if connections <= 0:
+            raise AssertionError(f"connections={connections} must be positive")
+        self._auth_args = auth_args
+        self._destroyed = False
+        self._next = 0
+        self._slots = [
+            _Slot(
+                self,
+                h.copy().pkupdate(
+                    reconnect_secs=reconnect_secs,
+                    reconnect_max_secs=reconnect_max_secs,
+                ),
+            )
+            for h in http_configs
+            for _ in range(connections)
+        ]
+        if not self._slots:
+            raise AssertionError("http_configs is empty")
+
+    async def call_api(self, api_name, api_args, **kwargs):
+        """Make a request on the least busy connection
+
+        See `client.Client.call_api`
+        """
+        s = self._slot()
+        s.outstanding += 1
+        try:
+            return await s.client.call_api(api_name, api_args, **kwargs)
+        finally:
+            s.outstanding -= 1
+
+    async def connect(self):
+        """Connect all clients
+
+        Succeeds if at least one connection is made. The others
+        reconnect in the background.
+
+        Returns:
+            Pool: self
+        """
+        if self._destroyed:
+            raise AssertionError("destroyed")
+        e = None
+        for r in await asyncio.gather(
+            *(s.connect() for s in self._slots), return_exceptions=True
+        ):
+            if isinstance(r, Exception):
+                e = r
+        if not any(s.is_connected() for s in self._slots):
+            self.destroy()
+            # no exception if destroyed while connecting
+            raise e or util.APIDisconnected()
+        return self
+
+    def destroy(self):
+        """Must be called"""
+        if self._destroyed:
+            return
+        self._destroyed = True
+        for s in self._slots:
+            s.destroy()
+
+    def stats(self):
+        """Connection state for monitoring
+
+        Returns:
+            list: PKDict(connected, outstanding, uri) plus `client.Client.stats` for each connection
+        """
+        return [s.stats() for s in self._slots]
+
+    async def subscribe_api(self, api_name, api_args, **kwargs):
+        """Subscribe on the least busy connection
+
+        See `client.Client.subscribe_api`
+        """
+        return await self._slot().client.subscribe_api(api_name, api_args, **kwargs)
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *args, **kwargs):
+        self.destroy()
+        return False
+
+    def _slot(self):
+        if self._destroyed:
+            raise util.APIDisconnected()
+        rv = None
+        n = len(self._slots)
+        # round robin among equally busy connections
+        for i in range(self._next, self._next + n):
+            s = self._slots[i % n]
+            if s.is_connected() and (rv is None or s.outstanding < rv.outstanding):
+                rv = s
+        if rv is None:
+            raise util.APIDisconnected()
+        self._next = (self._slots.index(rv) + 1) % n
+        return rv
+
+
+class _Slot:
+    def __init__(self, pool, http_config):
+        self.client = None
+        self.outstanding = 0
+        self.uri = client.uri(http_config)
+        self._http_config = http_config
+        self._pool = pool
+
+    async def connect(self):
+        self.client = client.Client(self._http_config.copy())
+        try:
+            await self.client.connect(self._pool._auth_args)
+        except Exception:
+            if not self._pool._destroyed:
+                if self.client.is_destroyed():
+                    # authentication failed
+                    self.client = client.Client(self._http_config.copy())
+                self.client.reconnect(self._pool._auth_args)
+            raise
+        if self._pool._destroyed:
+            self.destroy()
+
+    def destroy(self):
+        if self.client:
+            self.client.destroy()
+            self.client = None
+
+    def is_connected(self):
+        return self.client is not None and self.client.is_connected()
+
+    def stats(self):
+        return PKDict(
+            connected=self.is_connected(),
+            outstanding=self.outstanding,
+            uri=self.uri,
+        ).pkupdate(self.client.stats() if self.client else PKDict())
@@ -8,17 +8,56 @@ from pykern.pkcollections import PKDict
 from pykern.pkdebug import pkdc, pkdlog, pkdp, pkdexc
 from pykern.api import util
 import asyncio
+import bisect
+import collections
+import concurrent.futures
 import importlib
 import inspect
+import multiprocessing
+import os
 import pykern.pkasyncio
+import pykern.pkjson
 import pykern.quest
 import pykern.util
+import tornado.web
 import tornado.websocket
 import re
+import threading
+import time
 
 
 _API_NAME_RE = re.compile(rf"^{pykern.quest.API.METHOD_PREFIX}(\w+)")
 
+#: Defaults for limits in ``http_config``; None is unlimited
+_CALL_LIMITS = PKDict(
+    max_calls=None,
+    max_connection_calls=None,
+    max_connection_queue=None,
+)
+
+#: Upper bounds of latency histogram buckets in `api_stats`
+LATENCY_BUCKET_SECS = (
+    0.0001,
+    0.0002,
+    0.0005,
+    0.001,
+    0.002,
+    0.005,
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.5,
+    1,
+    2,
+    5,
+    10,
+)
+
+#: Set by `_Server` for `call_stats` and `publish` (one per process)
+_server = None
+
 
 class Session(pykern.quest.Attr):
     """State held on server bound to a client.
@@ -38,6 +77,39 @@ class Session(pykern.quest.Attr):
                 s()
 
 
+class Deadline(pykern.quest.Attr):
+    """When the client gives up on the call
+
+    Set from ``timeout`` in `pykern.api.client.Client.call_api` or
+    `pykern.api.client.Client.subscribe_api`. Async apis are
+    cancelled at the deadline. Blocking apis are not so they should
+    check `is_expired` to give up early.
+    """
+
+    ATTR_KEY = "deadline"
+
+    def __init__(self, monotonic):
+        super().__init__(None, _monotonic=monotonic)
+
+    def is_expired(self):
+        """Has the deadline passed?
+
+        Returns:
+            bool: False if there is no deadline
+        """
+        return self._monotonic is not None and time.monotonic() >= self._monotonic
+
+    def remaining_secs(self):
+        """Seconds until the deadline
+
+        Returns:
+            float: zero if expired or None if there is no deadline
+        """
+        if self._monotonic is None:
+            return None
+        return max(0.0, self._monotonic - time.monotonic())
+
+
 class Subscription(pykern.quest.Attr):
     """EXPERIMENTAL"""
 
@@ -47,29 +119,337 @@ class Subscription(pykern.quest.Attr):
         super().__init__(None, _server_msg=server_msg)
 
     def result_put(self, api_result):
+        """Send or, if the client has no credits, queue `api_result`
+
+        With overflow ``wait``, at most the client's initial credits
+        may be queued. Beyond that the subscription fails with
+        `util.APICallError`; use `result_send` to wait for credits.
+
+        Args:
+            api_result (object): sent to client
+        """
         self._server_msg.subscription_result_put(api_result)
 
+    async def topic_listen(self, *topics):
+        """Receive results from `publish` until the subscription ends
+
+        Returns when the client unsubscribes or disconnects.
+
+        Args:
+            topics (object): hashable names passed to `publish`
+        """
+        await self._server_msg.subscription_topic_listen(topics)
+
+    async def result_send(self, api_result):
+        """Wait for a credit if overflow is ``wait`` and then `result_put`
+
+        Args:
+            api_result (object): sent to client
+        """
+        await self._server_msg.subscription_credit_wait()
+        self.result_put(api_result)
+
+
+def publish(topic, api_result):
+    """Send `api_result` to all subscriptions listening to `topic`
+
+    `api_result` is serialized once for all subscribers, not once per
+    subscriber as with `Subscription.result_put`. Each subscriber still
+    costs a copy of the serialized message (to append its call_id)
+    and, if the connection is compressed, deflating the message. Flow
+    control applies as with `Subscription.result_put`.
+
+    Args:
+        topic (object): hashable name passed to `Subscription.topic_listen`
+        api_result (object): sent to subscribers; may not be None or an exception
+    Returns:
+        int: number of subscriptions sent to
+    """
+    if not _server:
+        raise AssertionError("server not started")
+    if not (s := _server.topics.get(topic)):
+        return 0
+    r = _PackedReply(api_result, _server.packer)
+    rv = 0
+    for m in list(s):
+        if m.is_destroyed():
+            continue
+        try:
+            m.subscription_result_put(r)
+            rv += 1
+        except (util.APIDisconnected, util.APICallError):
+            # subscription ended or failed (see Subscription.result_put)
+            pass
+    return rv
+
+
+def api_stats():
+    """Counts and latencies by api_name for monitoring
+
+    Each api has ``calls``, ``errors``, ``in_flight`` (current count),
+    and histograms ``queue_wait`` (waiting for call limits, see
+    `start`), ``execution`` (api function; not recorded for
+    subscriptions), and ``serialization`` (packing replies). A
+    histogram has ``buckets`` (counts, one more than
+    `LATENCY_BUCKET_SECS` for larger values), ``count``,
+    ``total_secs``, and ``max_secs``. `util.cache` apis also have
+    ``cache`` with ``hits``, ``misses``, and ``size``.
+
+    Returns:
+        PKDict: ``apis`` by api_name and ``bucket_secs``
+    """
+    if not _server:
+        raise AssertionError("server not started")
+    rv = PKDict({k: v.stats() for k, v in _server.api_stats.items()})
+    for k, v in rv.items():
+        if c := _server.api_map[k].cache:
+            v.cache = c.stats()
+    return PKDict(apis=rv, bucket_secs=list(LATENCY_BUCKET_SECS))
+
+
+def cache_invalidate(api_name, api_args=None):
+    """Discard cached results of a `util.cache` api
+
+    Args:
+        api_name (str): api without prefix
+        api_args (object): discard only this result [None: all]
+    Returns:
+        int: number of results discarded
+    """
+    if not _server:
+        raise AssertionError("server not started")
+    if not (a := _server.api_map.get(api_name)) or not a.cache:
+        raise AssertionError(f"api_name={api_name} is not cached")
+    return a.cache.invalidate(api_args)
+
+
+def call_stats():
+    """Concurrency of calls for monitoring
+
+    Each entry contains ``in_flight`` and ``queued`` (current
+    counts), ``max_queued``, ``queued_total`` (calls which had to
+    wait), ``rejected``, ``wait_secs`` (total), and ``max_wait_secs``.
+
+    Returns:
+        PKDict: ``server`` (global limit) and ``connections`` by ws_id
+    """
+    if not _server:
+        raise AssertionError("server not started")
+    return PKDict(
+        server=_server.call_limiter.stats(),
+        connections=PKDict(
+            {str(k): v.call_limiter.stats() for k, v in _server.connections.items()}
+        ),
+    )
+
 
 def start(api_classes, attr_classes, http_config, coros=()):
     """Start `_Server` in `pkasyncio`
 
+    `util.blocking` api functions run on pools sized by
+    ``http_config.blocking_threads`` and
+    ``http_config.blocking_processes`` (default: `concurrent.futures`).
+
+    Websocket compression (permessage-deflate) is enabled by
+    ``http_config.compression_level`` (0 to 9). Messages smaller than
+    ``http_config.compression_min_size`` are not compressed.
+
+    Concurrent calls (not subscriptions) are limited by
+    ``http_config``: ``max_calls`` for the whole server,
+    ``max_connection_calls`` for each connection, and
+    ``max_connection_queue`` calls waiting for a slot on a
+    connection. A call beyond ``max_connection_queue`` is rejected with
+    `util.APIProtocolError`, which closes the connection. All default
+    to None (unlimited). See `call_stats` for monitoring.
+
+    Per api counts and latencies are always recorded (see
+    `api_stats`). If ``http_config.stats_api`` is true, the api
+    ``api_server_stats`` returns them. If ``http_config.stats_uri``
+    is set, they are served as JSON by a plain HTTP GET on that uri,
+    which is not authenticated.
+
+    Only one server may run in a process, because `publish` and
+    `call_stats` operate on it. It is released when `start` returns.
+
     Args:
         api_classes (Iterable): `pykern.quest.API` subclasses to be dispatched
         attr_classes (Iterable): `pykern.quest.Attr` subclasses to create API instance
-        http_config (PKDict): `pkasyncio.Loop.http_server` arg
+        http_config (PKDict): `pkasyncio.Loop.http_server` arg and limits
         coros (Iterable): list of coroutines to be passed to `pkasyncio.Loop.run`
     """
     l = pykern.pkasyncio.Loop()
-    _Server(l, api_classes, attr_classes, http_config)
-    if coros:
-        l.run(*coros)
-    l.start()
+    s = _Server(l, api_classes, attr_classes, http_config)
+    try:
+        if coros:
+            l.run(*coros)
+        l.start()
+    finally:
+        s.destroy()
+
+
+class _APICache:
+    """Least recently used results of a `util.cache` api"""
+
+    def __init__(self, config):
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._max_size = config.max_size
+        self._packer = util.msg_packer() if config.packed else None
+        self._ttl_secs = config.ttl_secs
+
+    def get(self, key):
+        if key is None or (e := self._entries.get(key)) is None:
+            self.misses += 1
+            return None
+        if e.expiry is not None and e.expiry <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return e.value
+
+    def invalidate(self, api_args):
+        if api_args is None:
+            rv = len(self._entries)
+            self._entries.clear()
+            return rv
+        return 0 if self._entries.pop(self.key(api_args), None) is None else 1
+
+    def key(self, api_args):
+        try:
+            return util.cache_key(api_args)
+        except Exception as e:
+            pkdc("not cached api_args={} exception={}", api_args, e)
+            return None
+
+    def put(self, key, api_result):
+        if key is None or api_result is None or isinstance(api_result, Exception):
+            return api_result
+        rv = _PackedReply(api_result, self._packer) if self._packer else api_result
+        self._entries[key] = PKDict(
+            expiry=(
+                None if self._ttl_secs is None else time.monotonic() + self._ttl_secs
+            ),
+            value=rv,
+        )
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+        return rv
+
+    def stats(self):
+        return PKDict(hits=self.hits, misses=self.misses, size=len(self._entries))
+
+
+class _APIStats:
+    """Counts and latency histograms for one api"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.timeouts = 0
+        self.execution = _Histogram()
+        self.queue_wait = _Histogram()
+        self.serialization = _Histogram()
+
+    def stats(self):
+        return PKDict(
+            calls=self.calls,
+            errors=self.errors,
+            in_flight=self.in_flight,
+            timeouts=self.timeouts,
+            execution=self.execution.stats(),
+            queue_wait=self.queue_wait.stats(),
+            serialization=self.serialization.stats(),
+        )
+
+
+class _BlockingActionLoop(pykern.pkasyncio.ActionLoop):
+    """Runs blocking api functions serially in one thread"""
+
+    def action_call(self, arg):
+        try:
+            r = arg.func(arg.api_args)
+            arg.loop.call_soon_threadsafe(_future_set, arg.future, r, None)
+        except Exception as e:
+            arg.loop.call_soon_threadsafe(_future_set, arg.future, None, e)
+        return None
+
+    async def call(self, func, api_args):
+        l = asyncio.get_running_loop()
+        rv = l.create_future()
+        self.action(
+            self.action_call, PKDict(api_args=api_args, func=func, future=rv, loop=l)
+        )
+        return await rv
+
+    def _destroy(self):
+        pass
+
+
+class _CallLimiter:
+    """Bounds concurrent calls and measures waiting for a slot
+
+    Args:
+        max_calls (int): concurrent calls or None for unlimited
+        max_queue (int): calls waiting before rejecting or None for unlimited
+    """
+
+    def __init__(self, max_calls, max_queue=None):
+        self._max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_calls) if max_calls else None
+        self._stats = PKDict(
+            in_flight=0,
+            max_queued=0,
+            max_wait_secs=0.0,
+            queued=0,
+            queued_total=0,
+            rejected=0,
+            wait_secs=0.0,
+        )
+
+    async def acquire(self):
+        s = self._stats
+        if self._semaphore and self._semaphore.locked():
+            if self._max_queue is not None and s.queued >= self._max_queue:
+                s.rejected += 1
+                raise util.APIProtocolError(
+                    f"too many queued calls max_queue={self._max_queue}"
+                )
+            s.queued += 1
+            s.queued_total += 1
+            s.max_queued = max(s.max_queued, s.queued)
+            t = time.monotonic()
+            try:
+                await self._semaphore.acquire()
+            finally:
+                s.queued -= 1
+                t = time.monotonic() - t
+                s.wait_secs += t
+                s.max_wait_secs = max(s.max_wait_secs, t)
+        elif self._semaphore:
+            # not locked so does not block
+            await self._semaphore.acquire()
+        s.in_flight += 1
+
+    def release(self):
+        self._stats.in_flight -= 1
+        if self._semaphore:
+            self._semaphore.release()
+
+    def stats(self):
+        return self._stats.copy()
 
 
 class _Server:
     def __init__(self, loop, api_classes, attr_classes, http_config):
         def _api_class_funcs():
             a = False
+            if http_config.get("stats_api"):
+                yield from _api_class_funcs1(_StatsAPI)
             for c in api_classes:
                 for r in _api_class_funcs1(c):
                     if r.name == util.AUTH_API_NAME:
@@ -86,11 +466,17 @@ class _Server:
                 if not (m := _API_NAME_RE.search(n)):
                     continue
                 yield PKDict(
+                    blocking=util.blocking_executor(o),
+                    cache=util.cache_config(o),
                     class_=clazz,
                     func=o,
                     func_name=n,
-                    is_subscription=util.is_subscription(o),
+                    is_static=isinstance(
+                        inspect.getattr_static(clazz, n), staticmethod
+                    ),
+                    is_subscription=(x := util.is_subscription(o)),
                     name=m.group(1),
+                    subscription_overflow=x and util.subscription_overflow(o),
                 )
 
         def _api_map():
@@ -101,24 +487,116 @@ class _Server:
                         "duplicate api={a.name} class={a.class_.__name__}"
                     )
                 # don't need to save func
-                if not inspect.iscoroutinefunction(a.pkdel("func")):
+                f = a.pkdel("func")
+                if a.pkdel("is_static"):
+                    if a.blocking != "process":
+                        raise AssertionError(
+                            f"api_func={a.func_name} staticmethod must be blocking process class={a.class_.__name__}"
+                        )
+                elif a.blocking == "process":
+                    # bound method would pickle the qcall
                     raise AssertionError(
-                        "api_func={n} is not async class={a.class_.__name__}"
+                        f"api_func={a.func_name} blocking process must be a staticmethod class={a.class_.__name__}"
                     )
+                if not a.blocking and not inspect.iscoroutinefunction(f):
+                    raise AssertionError(
+                        f"api_func={a.func_name} is not async class={a.class_.__name__}"
+                    )
+                if a.cache:
+                    if a.is_subscription:
+                        raise AssertionError(
+                            f"api_func={a.func_name} subscription may not be cached class={a.class_.__name__}"
+                        )
+                    a.cache = _APICache(a.cache)
                 rv[a.name] = a
             return rv
 
-        h = http_config.copy().pksetdefault(uri_map=[])
+        global _server
+
+        if _server:
+            raise AssertionError("only one server per process")
+        h = http_config.copy().pksetdefault(uri_map=[], **_CALL_LIMITS)
         self.loop = loop
         self.api_map = _api_map()
         self.attr_classes = attr_classes
+        self.connections = PKDict()
+        self.call_limits = PKDict({k: h.pkdel(k) for k in _CALL_LIMITS})
+        h.pksetdefault(**util.COMPRESSION_DEFAULTS)
+        self.compression_options = util.compression_options(h)
+        self.compression_min_size = h.pkdel("compression_min_size")
+        h.pkdel("compression_level")
+        self.call_limiter = _CallLimiter(self.call_limits.max_calls)
+        self.packer = util.msg_packer()
+        self.topics = PKDict()
+        self.blocking_config = PKDict(
+            {k: h.pkdel(k, None) for k in ("blocking_processes", "blocking_threads")}
+        )
+        self._executors = PKDict()
+        self.api_stats = PKDict()
+        h.pkdel("stats_api")
         h.uri_map = h.uri_map[:]
         h.uri_map.append((h.api_uri, _ServerHandler, PKDict(server=self)))
+        if u := h.pkdel("stats_uri"):
+            h.uri_map.append((u, _StatsHandler))
         self.api_uri = h.pkdel("api_uri")
         h.log_function = self._log_end
         self._ws_id = 0
+        _server = self
         loop.http_server(h)
 
+    async def blocking_call(self, executor, func, api_args):
+        """Call `func` outside the event loop
+
+        Args:
+            executor (str): member of `util.BLOCKING_EXECUTORS`
+            func (callable): api function
+            api_args (PKDict): passed to func
+        Returns:
+            object: result of func
+        """
+        if (e := self._executors.get(executor)) is None:
+            if executor == "action_loop":
+                e = _BlockingActionLoop()
+            elif executor == "process":
+                # forking a process with threads (executors, ActionLoop) may deadlock
+                e = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.blocking_config.blocking_processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_blocking_process_init,
+                    initargs=(os.getpid(),),
+                )
+            else:
+                e = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.blocking_config.blocking_threads,
+                    thread_name_prefix="api_blocking",
+                )
+            self._executors[executor] = e
+        if executor == "action_loop":
+            return await e.call(func, api_args)
+        return await asyncio.get_running_loop().run_in_executor(e, func, api_args)
+
+    def api_stats_get(self, api_name):
+        if (rv := self.api_stats.get(api_name)) is None:
+            rv = self.api_stats[api_name] = _APIStats()
+        return rv
+
+    def destroy(self):
+        """Shut down executors for blocking apis and release `_server`"""
+        global _server
+
+        if _server is self:
+            _server = None
+        x = self._executors
+        self._executors = PKDict()
+        for k, v in x.items():
+            try:
+                if k == "action_loop":
+                    v.destroy()
+                else:
+                    v.shutdown(wait=False, cancel_futures=True)
+            except Exception as e:
+                pkdlog("executor={} exception={} stack={}", k, e, pkdexc())
+
     def handle_get(self, handler):
         self._log(handler, "ws-get")
 
@@ -156,6 +634,44 @@ class _Server:
             self.loop.http_log(handler)
 
 
+class _Histogram:
+    """Latencies in `LATENCY_BUCKET_SECS` buckets"""
+
+    def __init__(self):
+        self._buckets = [0] * (len(LATENCY_BUCKET_SECS) + 1)
+        self._count = 0
+        self._max = 0.0
+        self._total = 0.0
+
+    def add(self, secs):
+        self._buckets[bisect.bisect_left(LATENCY_BUCKET_SECS, secs)] += 1
+        self._count += 1
+        self._total += secs
+        if secs > self._max:
+            self._max = secs
+
+    def stats(self):
+        return PKDict(
+            buckets=list(self._buckets),
+            count=self._count,
+            max_secs=self._max,
+            total_secs=self._total,
+        )
+
+
+class _PackedReply:
+    """Result packed once by `publish` or `_APICache`"""
+
+    def __init__(self, api_result, packer):
+        if api_result is None or isinstance(api_result, Exception):
+            raise util.APICallError(
+                f"api_result type={type(api_result)} may not be None or an exception"
+            )
+        self.reply = util.msg_pack_reply(api_result, packer)
+        # non-streamed batches include the result unpacked
+        self.api_result = api_result
+
+
 class _ServerConnection:
 
     def __init__(self, server, handler, ws_id):
@@ -163,15 +679,35 @@ class _ServerConnection:
         self.handler = handler
         self.ws_id = ws_id
         self.pending_msgs = []
+        self.packer = util.msg_packer()
+        self.call_limiter = _CallLimiter(
+            server.call_limits.max_connection_calls,
+            server.call_limits.max_connection_queue,
+        )
         self._destroyed = False
         self.session = Session(None)
         self.remote_peer = server.loop.remote_peer(handler.request)
+        server.connections[ws_id] = self
         self.log("ws-open")
 
+    async def call_acquire(self):
+        """Wait for a slot on this connection and then the server"""
+        await self.call_limiter.acquire()
+        try:
+            await self.server.call_limiter.acquire()
+        except BaseException:
+            self.call_limiter.release()
+            raise
+
+    def call_release(self):
+        self.server.call_limiter.release()
+        self.call_limiter.release()
+
     def destroy(self):
         if self._destroyed:
             return
         self._destroyed = True
+        self.server.connections.pkdel(self.ws_id)
         x = list(self.pending_msgs)
         self.pending_msgs = []
         while x:
@@ -187,12 +723,21 @@ class _ServerConnection:
     def handle_on_close(self):
         self.destroy()
 
+    def write(self, msg):
+        """Send serialized `msg` to client
+
+        Args:
+            msg (bytes): serialized message
+        """
+        util.ws_write(self.handler.ws_connection, msg, self.server.compression_min_size)
+
     async def handle_on_message(self, msg):
         if self._destroyed:
             return
         m = None
         try:
-            m = _ServerMsg(self)
+            # destroy cancels the task
+            m = _ServerMsg(self, task=asyncio.current_task())
             self.pending_msgs.append(m)
             if not await m.process(msg):
                 self.destroy()
@@ -229,6 +774,9 @@ class _ServerHandler(tornado.websocket.WebSocketHandler):
         self.pykern_api_context = PKDict()
         self.pykern_api_connection = None
 
+    def get_compression_options(self):
+        return self.pykern_api_server.compression_options
+
     async def get(self, *args, **kwargs):
         try:
             self.pykern_api_server.handle_get(self)
@@ -263,17 +811,43 @@ class _ServerHandler(tornado.websocket.WebSocketHandler):
 
 class _ServerMsg:
 
-    def __init__(self, connection):
+    def __init__(self, connection, batch=None, task=None):
         self._connection = connection
+        self._task = task
+        self._batch = batch
+        self._batch_msgs = []
+        self._batch_replies = []
+        self._batch_stream = False
         self._call = None
         self._qcall = None
         self._api = None
+        self._blocking = False
+        self._deadline = None
+        self._flow = None
+        self._flow_error = None
+        self._stats = None
+        self._timed_out = False
+        self._topics_ended = None
         self._destroyed = False
 
     def destroy(self, unsubscribe=False):
         if self._destroyed:
             return
         self._destroyed = True
+        for m in self._batch_msgs:
+            m.destroy()
+        if self._flow:
+            self._flow.destroy()
+        if self._topics_ended:
+            self._topics_ended.set()
+        if self._blocking:
+            # func is still using qcall; _blocking_call ends the quest
+            return
+        if (t := self._task) and not t.done() and t is not asyncio.current_task():
+            # quest.start ends the quest in error when CancelledError propagates
+            self._task = None
+            t.cancel()
+            return
         if not (c := self._qcall):
             return
         self._qcall = None
@@ -285,27 +859,9 @@ class _ServerMsg:
             if e:
                 self._log("unpack-error", "error={}", [e])
                 return False
-            if r := self._parse():
-                pass
-            elif self._call.msg_kind.is_unsubscribe():
-                self._unsubscribe(self._call.call_id)
-                return True
-            elif self._call.msg_kind.is_subscribe():
-                r = await self._do_call(Subscription(self))
-                if r is not None and not isinstance(r, Exception):
-                    r = util.APICallError(
-                        f"return type={type(r)} from subscription api must be None"
-                    )
-            else:
-                r = await self._do_call(None)
-            if self._destroyed:
-                return True
-            self._reply(r)
-            if isinstance(r, util.APIProtocolError):
-                self._log("protocol-error", "exception={}", [e])
-                return False
-            self._log("end")
-            return True
+            if self._call.msg_kind.is_batch():
+                return await self._batch_process()
+            return await self._process()
         except Exception as e:
             pkdlog("exception={} {} stack={}", e, self, pkdexc())
             self._log("process-error", "exception={}", [e])
@@ -314,6 +870,39 @@ class _ServerMsg:
         finally:
             self.destroy()
 
+    def is_destroyed(self):
+        return self._destroyed
+
+    async def subscription_credit_wait(self):
+        if self._destroyed:
+            raise util.APIDisconnected()
+        if self._flow:
+            await self._flow.credit_wait()
+
+    def subscription_reply(self, api_result):
+        if isinstance(api_result, _PackedReply):
+            self._write_packed(api_result)
+            return
+        self._reply(api_result)
+
+    async def subscription_topic_listen(self, topics):
+        if self._destroyed:
+            raise util.APIDisconnected()
+        t = self._connection.server.topics
+        self._topics_ended = asyncio.Event()
+        try:
+            for x in topics:
+                t.setdefault(x, set()).add(self)
+            await self._topics_ended.wait()
+            if self._flow_error:
+                raise self._flow_error
+        finally:
+            for x in topics:
+                if (s := t.get(x)) is not None:
+                    s.discard(self)
+                    if not s:
+                        t.pkdel(x)
+
     def subscription_result_put(self, api_result):
         if isinstance(api_result, Exception):
             raise util.APICallError(
@@ -321,26 +910,161 @@ class _ServerMsg:
             )
         if api_result is None:
             raise util.APICallError("api_result may not be None")
-        self._reply(api_result)
+        if self._flow_error:
+            raise self._flow_error
+        if self._flow:
+            try:
+                self._flow.put(api_result)
+            except util.APICallError as e:
+                # fail the subscription even if it is in topic_listen
+                self._flow_error = e
+                if self._topics_ended:
+                    self._topics_ended.set()
+                raise
+        else:
+            self.subscription_reply(api_result)
         if self._destroyed:
             raise util.APIDisconnected()
 
+    async def _batch_process(self):
+        """Run calls in a batch concurrently
+
+        Replies are sent in a single `MsgKind.BATCH` frame unless the
+        batch asks to ``stream``, in which case each reply is sent
+        when its call completes. Only the batch is logged, except for
+        errors.
+        """
+
+        async def _call(msg):
+            # gather wrapped msg in its own task
+            msg._task = asyncio.current_task()
+            try:
+                return await msg._process()
+            except Exception as e:
+                pkdlog("exception={} {} stack={}", e, msg, pkdexc())
+                msg._log("process-error", "exception={}", [e])
+                msg._reply(e)
+                return False
+            finally:
+                msg.destroy()
+
+        def _parse():
+            c = self._call.get("calls")
+            if not isinstance(c, list) or not c:
+                return util.APIProtocolError("batch calls must be a non-empty list")
+            for x in c:
+                if not isinstance(x, PKDict):
+                    return util.APIProtocolError(f"batch call type={type(x)}")
+                if (i := x.get("call_id")).__class__ is not int or i <= 0:
+                    return util.APIProtocolError(f"batch call_id={i} invalid")
+                x.msg_kind = util.MsgKind.CALL
+            return None
+
+        if r := _parse():
+            self._reply(r)
+            self._log("protocol-error", "exception={}", [r])
+            return False
+        self._batch_stream = bool(self._call.get("stream"))
+        for c in self._call.calls:
+            m = _ServerMsg(self._connection, batch=self)
+            m._call = c
+            self._batch_msgs.append(m)
+        self._log(
+            "batch", "calls={} stream={}", [len(self._batch_msgs), self._batch_stream]
+        )
+        rv = all(await asyncio.gather(*(_call(m) for m in self._batch_msgs)))
+        if self._destroyed:
+            return True
+        if not self._batch_stream:
+            self._write(
+                PKDict(
+                    call_id=self._call.call_id,
+                    msg_kind=util.MsgKind.BATCH,
+                    replies=self._batch_replies,
+                ),
+            )
+        self._log("end")
+        return rv
+
+    async def _blocking_call(self, func):
+        self._blocking = True
+        try:
+            rv = await self._connection.server.blocking_call(
+                self._api.blocking, func, self._call.api_args
+            )
+        finally:
+            self._blocking = False
+        if self._destroyed:
+            # quest.start ends the quest (in error) now that func is done
+            raise util.APIDisconnected()
+        if self._timed_out:
+            raise util.APITimeout(self._call.timeout)
+        return rv
+
     async def _do_call(self, sub):
+        a = False
+        h = None
+        s = self._stats = self._connection.server.api_stats_get(self._api.name)
+        s.calls += 1
         try:
-            # Let quest.start see the exception
-            with self._quest_start(sub) as c:
-                try:
-                    self._qcall = c
-                    return await getattr(c, self._api.func_name)(self._call.api_args)
-                finally:
-                    self._qcall = None
+            if self._deadline is not None:
+                # loop.time is time.monotonic, which Deadline uses
+                h = asyncio.get_running_loop().call_at(self._deadline, self._timeout)
+            if sub is None:
+                t = time.perf_counter()
+                # subscriptions are long lived so are not limited
+                await self._connection.call_acquire()
+                a = True
+                s.queue_wait.add(time.perf_counter() - t)
+            s.in_flight += 1
+            t = time.perf_counter()
+            try:
+                # Let quest.start see the exception
+                with self._quest_start(sub) as c:
+                    try:
+                        self._qcall = c
+                        f = getattr(c, self._api.func_name)
+                        if not (x := self._api.cache):
+                            return await self._func_call(f)
+                        if (rv := x.get(k := x.key(self._call.api_args))) is None:
+                            rv = x.put(k, await self._func_call(f))
+                        return rv
+                    finally:
+                        self._qcall = None
+            finally:
+                s.in_flight -= 1
+                if sub is None:
+                    s.execution.add(time.perf_counter() - t)
+        except asyncio.CancelledError:
+            s.errors += 1
+            if not self._timed_out or self._destroyed:
+                self._log("cancel-error")
+                raise
+            # Only the deadline cancelled the task so the call continues to reply
+            s.timeouts += 1
+            self._log("timeout-error", "timeout={}", [self._call.timeout])
+            return util.APITimeout(self._call.timeout)
         except Exception as e:
+            s.errors += 1
             pkdlog("exception={} {} stack={}", self, e, pkdexc())
             if not isinstance(e, pykern.util.APIError):
                 e = util.APICallError(f"unhandled_exception={e}")
             return e
+        finally:
+            if h:
+                h.cancel()
+            if a:
+                self._connection.call_release()
+
+    async def _func_call(self, func):
+        if self._api.blocking:
+            return await self._blocking_call(func)
+        return await func(self._call.api_args)
 
     def _log(self, which, *args):
+        if self._batch and not which.endswith("error"):
+            # batch is logged as a whole
+            return
         return self._connection.log(which, self, *args)
 
     def _parse(self):
@@ -357,10 +1081,27 @@ class _ServerMsg:
                 return None
             return util.APINotFound(n)
 
+        def _timeout():
+            if (t := self._call.get("timeout")) is None:
+                return None
+            if t.__class__ not in (int, float) or not t > 0:
+                return util.APIProtocolError(f"timeout={t} must be a positive number")
+            self._deadline = time.monotonic() + t
+            return None
+
+        def _credits(required):
+            if (c := self._call.get("credits")) is None and not required:
+                return None
+            if c.__class__ is not int or c <= 0:
+                return util.APIProtocolError(f"credits={c} must be a positive int")
+            return None
+
         def _kind():
             k = self._call.msg_kind
             if k.is_unsubscribe():
                 return None
+            if k.is_credit():
+                return _credits(True)
             if r := _name():
                 return r
             if k.is_subscribe():
@@ -368,6 +1109,8 @@ class _ServerMsg:
                     return util.APIKindError(
                         f"cannot subscribe non-subscription api={self._call.api_name}"
                     )
+                if r := _credits(False):
+                    return r
             elif k.is_call():
                 if self._api.is_subscription:
                     return util.APIKindError(
@@ -375,19 +1118,59 @@ class _ServerMsg:
                     )
             else:
                 raise AssertionError(f"invalid {k} returned from msg_unpack")
-            return _args()
+            return _timeout() or _args()
 
         self._log(self._call.msg_kind.name.lower())
         return _kind()
 
+    async def _process(self):
+        if r := self._parse():
+            pass
+        elif self._call.msg_kind.is_unsubscribe():
+            self._unsubscribe(self._call.call_id)
+            return True
+        elif self._call.msg_kind.is_credit():
+            self._credit(self._call.call_id, self._call.credits)
+            return True
+        elif self._call.msg_kind.is_subscribe():
+            if c := self._call.get("credits"):
+                self._flow = _SubscriptionFlow(self, c, self._api.subscription_overflow)
+            r = await self._do_call(Subscription(self))
+            if r is not None and not isinstance(r, Exception):
+                r = util.APICallError(
+                    f"return type={type(r)} from subscription api must be None"
+                )
+            elif r is None and self._flow and not self._destroyed:
+                # results queued for lack of credits precede the end
+                try:
+                    await self._flow.drain()
+                except util.APIDisconnected:
+                    pass
+        else:
+            r = await self._do_call(None)
+        if self._destroyed:
+            return True
+        self._reply(r)
+        if isinstance(r, util.APIProtocolError):
+            self._log("protocol-error", "exception={}", [r])
+            return False
+        self._log("end")
+        return True
+
     def _quest_start(self, sub=None):
         a = list(self._connection.server.attr_classes)
         a.append(self._connection.session)
+        a.append(Deadline(self._deadline))
         if sub:
             a.append(sub)
         return pykern.quest.start(self._api.class_, a)
 
     def _reply(self, call_rv):
+        if isinstance(call_rv, _PackedReply):
+            if not self._batch or self._batch._batch_stream:
+                self._write_packed(call_rv)
+                return
+            call_rv = call_rv.api_result
         try:
             if call_rv == None:
                 if self._call.msg_kind.is_subscribe():
@@ -405,13 +1188,34 @@ class _ServerMsg:
                 r = PKDict(api_result=None, api_error=f"unhandled_exception={call_rv}")
             r.pksetdefault(msg_kind=util.MsgKind.REPLY)
             r.call_id = self._call.call_id
-            self._connection.handler.write_message(util.msg_pack(r), binary=True)
+            if self._batch and not self._batch._batch_stream:
+                self._batch._batch_replies.append(r)
+                return
+            self._write(r)
             self._log("reply")
         except Exception as e:
             pkdlog("exception={} {} stack={}", e, self, pkdexc())
             self._log("reply-error")
             self.destroy()
 
+    def _write_packed(self, packed):
+        try:
+            self._connection.write(
+                util.msg_pack_reply_call_id(packed.reply, self._call.call_id),
+            )
+            self._log("reply")
+        except Exception as e:
+            pkdlog("exception={} {} stack={}", e, self, pkdexc())
+            self._log("reply-error")
+            self.destroy()
+
+    def _write(self, msg):
+        t = time.perf_counter()
+        m = util.msg_pack(msg, self._connection.packer)
+        if self._stats:
+            self._stats.serialization.add(time.perf_counter() - t)
+        self._connection.write(m)
+
     def __str__(self):
         def _destroyed():
             return " DESTROYED" if self._destroyed else ""
@@ -430,8 +1234,121 @@ class _ServerMsg:
 
         return _info(self._call) or f"<{self.__class__.__name__}{_destroyed()}>"
 
+    def _credit(self, call_id, credits):
+        for m in self._connection.pending_msgs:
+            if m._call and m._call.get("call_id") == call_id and m._flow:
+                m._flow.credit(credits)
+                return
+
+    def _timeout(self):
+        self._timed_out = True
+        if self._blocking:
+            # func is still using qcall; _blocking_call raises APITimeout
+            return
+        if (t := self._task) and not t.done():
+            t.cancel()
+
     def _unsubscribe(self, call_id):
         for m in self._connection.pending_msgs:
             if m._call and m._call.get("call_id") == call_id and m._api:
                 if m._api.is_subscription:
                     m.destroy(unsubscribe=True)
+
+
+class _StatsAPI(pykern.quest.API):
+    """Built-in api enabled by ``http_config.stats_api``"""
+
+    async def api_api_server_stats(self, api_args):
+        return api_stats()
+
+
+class _StatsHandler(tornado.web.RequestHandler):
+    """Serves `api_stats` as JSON for ``http_config.stats_uri``"""
+
+    def get(self):
+        self.set_header("Content-Type", "application/json")
+        self.write(pykern.pkjson.dump_bytes(api_stats()))
+
+
+class _SubscriptionFlow:
+    """Credit based flow control for a subscription
+
+    Args:
+        server_msg (_ServerMsg): subscription
+        credits (int): initial credits granted by client
+        overflow (str): member of `util.SUBSCRIPTION_OVERFLOWS`
+    """
+
+    def __init__(self, server_msg, credits, overflow):
+        self._server_msg = server_msg
+        self._credits = credits
+        # bounds _pending for overflow wait
+        self._window = credits
+        self._overflow = overflow
+        self._pending = collections.deque()
+        self._credited = asyncio.Event()
+
+    def credit(self, credits):
+        self._credits += credits
+        self._send()
+        self._credited.set()
+
+    async def credit_wait(self):
+        if self._overflow == "latest":
+            return
+        while not self._credits or self._pending:
+            await self._wait()
+
+    def destroy(self):
+        self._pending.clear()
+        self._credited.set()
+
+    async def drain(self):
+        while self._pending:
+            await self._wait()
+
+    def put(self, api_result):
+        if self._overflow == "latest":
+            # coalesce
+            self._pending.clear()
+        elif len(self._pending) >= self._window:
+            raise util.APICallError(
+                f"subscription results queued exceed credits={self._window}; use result_send"
+            )
+        self._pending.append(api_result)
+        self._send()
+
+    def _send(self):
+        while self._credits and self._pending:
+            self._credits -= 1
+            self._server_msg.subscription_reply(self._pending.popleft())
+
+    async def _wait(self):
+        self._credited.clear()
+        await self._credited.wait()
+        if self._server_msg.is_destroyed():
+            raise util.APIDisconnected()
+
+
+def _blocking_process_init(parent_pid):
+    """Exit process pool worker when the server dies
+
+    Workers hold both ends of the call queue so they never see EOF
+    if the server is killed.
+    """
+
+    def _watch():
+        while os.getppid() == parent_pid:
+            time.sleep(1)
+        os._exit(1)
+
+    threading.Thread(target=_watch, daemon=True).start()
+
+
+def _future_set(future, result, exception):
+    if future.cancelled():
+        return
+    if exception is None:
+        future.set_result(result)
+    else:
+        future.set_exception(exception)
@@ -12,6 +12,9 @@ import time
 
 _AUTH_TOKEN = "http_unit_auth_secret"
 
+#: Reported by `LoadTest` and compared by `LoadTest.baseline_compare`
+PERCENTILES = (50, 95, 99)
+
 
 class Setup:
     """Usage::
@@ -171,3 +174,204 @@ class Setup:
     async def __aexit__(self, *args, **kwargs):
         self.destroy()
         return False
+
+
+class LoadTest(Setup):
+    """Benchmark a server with concurrent clients on localhost
+
+    Usage::
+
+        async with unit_util.LoadTest(
+            workloads=(
+                PKDict(api_name="echo", api_args=PKDict(), weight=3),
+                PKDict(api_name="sub1", api_args=PKDict(iter_count=5), subscribe=True),
+            ),
+            clients=8,
+            ops=100,
+            api_classes=(_class(),),
+        ) as t:
+            r = await t.run()
+            pkunit.pkeq([], t.baseline_compare(r, pkunit.data_dir().join("baseline.json")))
+
+    Each client connects and authenticates, then makes ``ops``
+    requests one at a time. Each request is a workload chosen randomly
+    by ``weight`` (default 1). A workload is a call unless
+    ``subscribe`` is true, in which case the latency is the time to
+    receive all results of the subscription. Workloads are named by
+    ``name`` (default: ``api_name``).
+
+    Clients are tasks in this process unless ``processes`` is set, in
+    which case each of ``processes`` spawned processes runs
+    ``clients`` clients.
+
+    Args:
+        workloads (Iterable): PKDict(api_name, api_args, name, subscribe, weight)
+        clients (int): clients (per process) [4]
+        ops (int): requests per client [100]
+        processes (int): spawned processes to run clients [None]
+        seed (int): for choosing workloads [1]
+        server_config (dict): passed to `Setup`
+    """
+
+    def __init__(
+        self, workloads, clients=4, ops=100, processes=None, seed=1, **server_config
+    ):
+        self.load_config = PKDict(
+            clients=clients,
+            ops=ops,
+            processes=processes,
+            seed=seed,
+            workloads=[
+                PKDict(w).pksetdefault(name=w["api_name"], subscribe=False, weight=1)
+                for w in workloads
+            ],
+        )
+        if not self.load_config.workloads:
+            raise AssertionError("workloads is empty")
+        super().__init__(**server_config)
+
+    def baseline_compare(self, report, path, tolerance=0.25):
+        """Compare `report` to the baseline in `path`
+
+        If `path` does not exist, `report` is written to it.
+
+        Args:
+            report (PKDict): from `run`
+            path (py.path): JSON baseline
+            tolerance (float): allowed fraction worse than baseline [0.25]
+        Returns:
+            list: regressions (str); empty if none
+        """
+        from pykern import pkio, pkjson
+
+        if not path.exists():
+            pkio.mkdir_parent_only(path)
+            pkjson.dump_pretty(report, filename=path)
+            return []
+        b = pkjson.load_any(path)
+        rv = []
+        if report.ops_per_sec < b.ops_per_sec * (1 - tolerance):
+            rv.append(
+                f"ops_per_sec={report.ops_per_sec:.1f} baseline={b.ops_per_sec:.1f}"
+            )
+        for n, l in report.latency.items():
+            if not (x := b.latency.get(n)):
+                continue
+            for k in _percentile_keys():
+                if l[k] > x[k] * (1 + tolerance):
+                    rv.append(f"{n} {k}={l[k]:.6f} baseline={x[k]:.6f}")
+        return rv
+
+    async def run(self):
+        """Run the workloads
+
+        Returns:
+            PKDict: clients, errors, ops, ops_per_sec, secs, and
+            latency (secs at `PERCENTILES`, max, count) for ``all``
+            and by workload name; may be serialized as JSON
+        """
+        import asyncio, time
+
+        c = self.load_config
+        a = (
+            self.http_config,
+            PKDict(token=_AUTH_TOKEN),
+            c.workloads,
+            c.clients,
+            c.ops,
+        )
+        t = time.perf_counter()
+        if c.processes:
+            import concurrent.futures, multiprocessing
+
+            l = asyncio.get_running_loop()
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=c.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as p:
+                r = await asyncio.gather(
+                    *(
+                        l.run_in_executor(p, _load_process, *a, c.seed + i * c.clients)
+                        for i in range(c.processes)
+                    )
+                )
+        else:
+            r = [await _load_clients(*a, c.seed)]
+        t = time.perf_counter() - t
+        s = PKDict({w.name: [] for w in c.workloads})
+        e = 0
+        for x in r:
+            e += x.errors
+            for k, v in x.latencies.items():
+                s[k].extend(v)
+        n = sum(len(v) for v in s.values())
+        return PKDict(
+            clients=c.clients * (c.processes or 1),
+            errors=e,
+            latency=PKDict(
+                all=_latency([y for v in s.values() for y in v]),
+                **{k: _latency(v) for k, v in s.items()},
+            ),
+            ops=n,
+            ops_per_sec=n / t,
+            secs=t,
+        )
+
+    async def __aenter__(self):
+        await super().__aenter__()
+        return self
+
+
+async def _load_clients(http_config, auth_args, workloads, clients, ops, seed):
+    from pykern.api import client
+    import asyncio, pykern.util, random, time
+
+    async def _client(index):
+        c = client.Client(http_config.copy())
+        try:
+            await c.connect(auth_args)
+            r = random.Random(seed + index)
+            for w in r.choices(workloads, weights=[w.weight for w in workloads], k=ops):
+                t = time.perf_counter()
+                try:
+                    if w.subscribe:
+                        with await c.subscribe_api(w.api_name, w.api_args) as s:
+                            while await s.result_get() is not None:
+                                pass
+                    else:
+                        await c.call_api(w.api_name, w.api_args)
+                except pykern.util.APIError:
+                    rv.errors += 1
+                    continue
+                rv.latencies[w.name].append(time.perf_counter() - t)
+        finally:
+            c.destroy()
+
+    rv = PKDict(errors=0, latencies=PKDict({w.name: [] for w in workloads}))
+    await asyncio.gather(*(_client(i) for i in range(clients)))
+    return rv
+
+
+def _latency(values):
+    if not values:
+        return PKDict(count=0, max=0.0, **{k: 0.0 for k in _percentile_keys()})
+    v = sorted(values)
+    return PKDict(
+        count=len(v),
+        max=v[-1],
+        # nearest rank
+        **{
+            k: v[max(0, -(-p * len(v) // 100) - 1)]
+            for k, p in zip(_percentile_keys(), PERCENTILES)
+        },
+    )
+
+
+def _load_process(*args):
+    import asyncio
+
+    return asyncio.run(_load_clients(*args))
+
+
+def _percentile_keys():
+    return [f"p{p}" for p in PERCENTILES]
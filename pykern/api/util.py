@@ -6,17 +6,40 @@
 
 # Limit pykern imports
 from pykern.pkcollections import PKDict
+import array
 import datetime
 import enum
+import hashlib
 import inspect
 import msgpack
 import pykern.util
+import struct
+import sys
+import tornado.websocket
+
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
 
 #: API that authenticates connections (needed for client)
 AUTH_API_NAME = "authenticate_connection"
 
 #: API version for AUTH (and for pykern.api)
-AUTH_API_VERSION = 658584001
+AUTH_API_VERSION = 658584002
+
+#: Where `blocking` api functions run
+BLOCKING_EXECUTORS = frozenset(("action_loop", "process", "thread"))
+
+#: Defaults for websocket compression in ``http_config``
+COMPRESSION_DEFAULTS = PKDict(
+    # None disables permessage-deflate
+    compression_level=None,
+    compression_min_size=1024,
+)
+
+#: What a flow controlled subscription does when the client has no credits
+SUBSCRIPTION_OVERFLOWS = frozenset(("latest", "wait"))
 
 # Protocol code shared between client & server, not public
 
@@ -29,10 +52,18 @@ class MsgKind(enum.Enum):
     REPLY = _MSG_KIND_BASE + 2
     SUBSCRIBE = _MSG_KIND_BASE + 3
     UNSUBSCRIBE = _MSG_KIND_BASE + 4
+    BATCH = _MSG_KIND_BASE + 5
+    CREDIT = _MSG_KIND_BASE + 6
+
+    def is_batch(self):
+        return self is self.BATCH
 
     def is_call(self):
         return self is self.CALL
 
+    def is_credit(self):
+        return self is self.CREDIT
+
     def is_reply(self):
         return self is self.REPLY
 
@@ -43,14 +74,62 @@ class MsgKind(enum.Enum):
         return self is self.UNSUBSCRIBE
 
 
+#: Valid `MsgKind` values by receiver, mapped to `MsgKind`
 _MSG_KIND_IS_VALID = PKDict(
-    client=frozenset((MsgKind.REPLY, MsgKind.UNSUBSCRIBE)),
-    server=frozenset((MsgKind.CALL, MsgKind.SUBSCRIBE, MsgKind.UNSUBSCRIBE)),
+    {
+        w: {k.value: k for k in v}
+        for w, v in (
+            ("client", (MsgKind.REPLY, MsgKind.UNSUBSCRIBE, MsgKind.BATCH)),
+            (
+                "server",
+                (
+                    MsgKind.CALL,
+                    MsgKind.SUBSCRIBE,
+                    MsgKind.UNSUBSCRIBE,
+                    MsgKind.BATCH,
+                    MsgKind.CREDIT,
+                ),
+            ),
+        )
+    }
 )
 
 
+_BLOCKING_ATTR = "pykern_api_util_blocking"
+
+_CACHE_ATTR = "pykern_api_util_cache"
+
 _SUBSCRIPTION_ATTR = "pykern_api_util_subscription"
 
+#: msgpack ExtType code for arrays: packed (dtype, shape) followed by raw data
+_EXT_ARRAY = 1
+
+#: msgpack ExtType code for dicts in `cache_key` (never sent)
+_EXT_CACHE_DICT = 2
+
+#: numpy dtype kinds sent as raw data; others are sent with tolist
+_EXT_ARRAY_KINDS = frozenset("biufc")
+
+#: numpy dtype kind and itemsize to struct format (used without numpy)
+_STRUCT_FORMAT = PKDict(
+    b1="?",
+    i1="b",
+    i2="h",
+    i4="i",
+    i8="q",
+    u1="B",
+    u2="H",
+    u4="I",
+    u8="Q",
+    f2="e",
+    f4="f",
+    f8="d",
+    c8="f",
+    c16="d",
+)
+
+_NATIVE_BYTE_ORDER = "<" if sys.byteorder == "little" else ">"
+
 
 class APICallError(pykern.util.APIError):
     """Raised when call execution ends in exception or other error"""
@@ -94,6 +173,13 @@ class APIProtocolError(pykern.util.APIError):
         super().__init__("error={}", error)
 
 
+class APITimeout(pykern.util.APIError):
+    """Raised when a call does not complete before its deadline"""
+
+    def __init__(self, timeout):
+        super().__init__("timeout={}", timeout)
+
+
 def is_subscription(func):
     """Is `func` a subscription api?
 
@@ -102,80 +188,463 @@ def is_subscription(func):
     Returns:
         bool: True if is subscription api
     """
-    return getattr(func, _SUBSCRIPTION_ATTR, False)
+    return bool(getattr(func, _SUBSCRIPTION_ATTR, None))
 
 
-def msg_pack(unserialized):
-    """Used by client and server, not public"""
+def msg_pack(unserialized, packer=None):
+    """Used by client and server, not public
+
+    Args:
+        unserialized (object): message
+        packer (msgpack.Packer): from `msg_packer` [None: create one]
+    Returns:
+        bytes: serialized message
+    """
+    # tornado's write_message only accepts bytes so Packer.getbuffer
+    # would be copied anyway. pack() with autoreset copies exactly once.
+    return (packer or msg_packer()).pack(unserialized)
+
+
+def msg_pack_reply(api_result, packer=None):
+    """Pack a reply once to be sent to many calls, not public
+
+    The result is serialized once. The message is completed for each
+    call with `msg_pack_reply_call_id`, which only packs ``call_id``
+    but copies the message.
+
+    Args:
+        api_result (object): reply value
+        packer (msgpack.Packer): from `msg_packer` [None: create one]
+    Returns:
+        bytes: message missing the value of ``call_id``
+    """
+    p = packer or msg_packer()
+    return b"".join(
+        (
+            # fixmap with four entries; call_id must be last
+            b"\x84",
+            p.pack("api_error"),
+            p.pack(None),
+            p.pack("msg_kind"),
+            p.pack(MsgKind.REPLY.value),
+            p.pack("api_result"),
+            p.pack(api_result),
+            p.pack("call_id"),
+        ),
+    )
+
+
+def msg_pack_reply_call_id(reply, call_id):
+    """Complete message from `msg_pack_reply`, not public
+
+    Concatenation copies ``reply`` so the cost is a memcpy of the
+    payload per call, which is still much less than packing it.
+
+    Args:
+        reply (bytes): from `msg_pack_reply`
+        call_id (int): call receiving reply
+    Returns:
+        bytes: serialized message
+    """
+    return reply + msgpack.packb(call_id)
 
-    def _default(obj):
-        if isinstance(obj, datetime.datetime):
-            return int(obj.timestamp())
-        if isinstance(obj, enum.Enum):
-            return obj.value
-        if hasattr(obj, "tolist"):
-            # tolist works with pandas and numpy. If tolist takes
-            # params or not a callable, then the result will be the
-            # essentially the same as not having this code.
-            return obj.tolist()
-        return obj
 
-    p = msgpack.Packer(autoreset=False, default=_default)
-    p.pack(unserialized)
-    # TODO(robnagler) getbuffer() would be better
-    return p.bytes()
+def msg_packer():
+    """Create a packer to be reused for `msg_pack`, not public
+
+    Packers are not thread safe so each connection holds its own.
+
+    Returns:
+        msgpack.Packer: packer that returns bytes from pack
+    """
+    return msgpack.Packer(autoreset=True, default=_msg_pack_default)
 
 
 def msg_unpack(serialized, which):
-    """Used by client and server, not public"""
-
-    def _int(rv, which):
-        i = rv[which]
-        if not isinstance(i, int):
-            return None, f"msg {which} non-integer type={type(i)}"
-        if i <= 0:
-            return None, f"msg {which} non-positive int={i}"
-        return None
+    """Used by client and server, not public
+
+    Args:
+        serialized (bytes): one complete message
+        which (str): "client" or "server" (receiver)
+    Returns:
+        tuple: (PKDict, None) or (None, str error)
 
-    def _kind(rv):
-        if r := _int(rv, "msg_kind"):
-            return r
+    Numeric arrays are unpacked as read-only `numpy.ndarray` (zero copy)
+    or nested lists if numpy is not installed.
+    """
+
+    def _error(rv, call_id, msg_kind):
+        if not call_id or not msg_kind:
+            return f"msg missing {'msg_kind' if call_id else 'call_id'} keys={list(rv.keys())}"
+        for k, v in ("call_id", call_id), ("msg_kind", msg_kind):
+            if v.__class__ is not int:
+                return f"msg {k} non-integer type={type(v)}"
+            if v <= 0:
+                return f"msg {k} non-positive int={v}"
         try:
-            k = MsgKind(rv.msg_kind)
-            if k not in _MSG_KIND_IS_VALID[which]:
-                return None, f"{k} invalid for {which}"
-            rv.msg_kind = k
-            return None
-        except Exception as e:
-            return None, f"msg_kind={rv.msg_kind} not in valid"
+            return f"{MsgKind(msg_kind)} invalid for {which}"
+        except Exception:
+            return f"msg_kind={msg_kind} not in valid"
 
     try:
-        u = msgpack.Unpacker(
-            object_hook=pykern.pkcollections.object_pairs_hook,
-        )
-        u.feed(serialized)
-        rv = u.unpack()
+        # PKDict has no __init__ so it never raises PKDictNameError
+        rv = msgpack.unpackb(serialized, ext_hook=_msg_unpack_ext, object_hook=PKDict)
     except Exception as e:
         return None, f"msgpack exception={e}"
     if not isinstance(rv, PKDict):
         return None, f"msg not dict type={type(rv)}"
-    for f in "call_id", "msg_kind":
-        if not rv.get(f):
-            return None, f"msg missing {f} keys={list(rv.keys())}"
-    return _int(rv, "call_id") or _kind(rv) or (rv, None)
+    i = rv.get("call_id")
+    k = rv.get("msg_kind")
+    # Exact class check excludes bool and avoids hashing unhashable values
+    if (
+        i.__class__ is not int
+        or i <= 0
+        or k.__class__ is not int
+        or (m := _MSG_KIND_IS_VALID[which].get(k)) is None
+    ):
+        return None, _error(rv, i, k)
+    rv["msg_kind"] = m
+    return rv, None
+
+
+def blocking(func=None, executor="thread"):
+    """Decorator for api functions which block or are CPU bound
+
+    The function is not a coroutine. The server calls it outside the
+    event loop::
+
+        @util.blocking
+        def api_query(self, api_args):
+
+        @staticmethod
+        @util.blocking(executor="process")
+        def api_compute(api_args):
+
+    ``executor`` selects where the function runs:
+
+    ``thread``
+        a thread pool; quest attributes are available and quest_end
+        runs on the event loop after the function returns
+    ``action_loop``
+        a single `pykern.pkasyncio.ActionLoop` thread so calls are
+        serialized, e.g. for libraries which are not thread safe
+    ``process``
+        a process pool (spawned, not forked); the function must be a
+        `staticmethod` which can be pickled by reference, i.e. defined
+        at module level, because quest state cannot be pickled
+
+    Args:
+        func (function): class api
+        executor (str): member of `BLOCKING_EXECUTORS` [``thread``]
+    Returns:
+        function: function to use
+    """
+
+    def _decorator(func):
+        if inspect.iscoroutinefunction(func):
+            raise AssertionError(f"func={func.__name__} must not be a coroutine")
+        setattr(func, _BLOCKING_ATTR, executor)
+        return func
+
+    if func is not None and not callable(func):
+        # e.g. @util.blocking("process")
+        raise AssertionError(f"func={func} not callable; pass executor as keyword")
+    if executor not in BLOCKING_EXECUTORS:
+        raise AssertionError(
+            f"executor={executor} must be one of {sorted(BLOCKING_EXECUTORS)}"
+        )
+    return _decorator if func is None else _decorator(func)
+
+
+def blocking_executor(func):
+    """Where `func` runs if it is `blocking`
+
+    Args:
+        func (function): class api
+    Returns:
+        str: member of `BLOCKING_EXECUTORS` or None if not blocking
+    """
+    return getattr(func, _BLOCKING_ATTR, None)
+
+
+def cache(func=None, max_size=128, packed=False, ttl_secs=None):
+    """Decorator for api functions whose results may be reused
+
+    Results are cached by api_name and `cache_key` of api_args so the
+    result may only depend on api_args. May be used with or without
+    arguments::
+
+        @util.cache
+        async def api_one(self, api_args):
+
+        @util.cache(max_size=1000, packed=True, ttl_secs=60)
+        async def api_two(self, api_args):
 
+    The quest is still started on a hit so attrs (e.g. authorization)
+    apply but the function is not called. Exceptions and None are not
+    cached. Cached results are shared by callers so must not be
+    modified. With ``packed``, the reply is stored serialized (see
+    `msg_pack_reply`) so hits are not serialized again. May be
+    combined with `blocking` but not `subscription`. Use
+    `pykern.api.server.cache_invalidate` when results change.
 
-def subscription(func):
+    Args:
+        func (function): class api
+        max_size (int): least recently used results are discarded beyond this [128]
+        packed (bool): store serialized reply [False]
+        ttl_secs (float): results expire after [None: never]
+    Returns:
+        function: function to use
+    """
+
+    def _decorator(func):
+        setattr(
+            func,
+            _CACHE_ATTR,
+            PKDict(max_size=max_size, packed=packed, ttl_secs=ttl_secs),
+        )
+        return func
+
+    if func is not None and not callable(func):
+        raise AssertionError(f"func={func} not callable; pass arguments as keywords")
+    if max_size.__class__ is not int or max_size <= 0:
+        raise AssertionError(f"max_size={max_size} must be a positive int")
+    if ttl_secs is not None and (
+        ttl_secs.__class__ not in (int, float) or not ttl_secs > 0
+    ):
+        raise AssertionError(f"ttl_secs={ttl_secs} must be a positive number")
+    return _decorator if func is None else _decorator(func)
+
+
+def cache_config(func):
+    """How `func` is cached if it is decorated with `cache`
+
+    Args:
+        func (function): class api
+    Returns:
+        PKDict: max_size, packed, and ttl_secs or None if not cached
+    """
+    return getattr(func, _CACHE_ATTR, None)
+
+
+def cache_key(api_args):
+    """Canonical hash of `api_args` for `cache`
+
+    Dicts are hashed with sorted keys so equal args hash the same
+    regardless of insertion order. Arrays are hashed by value.
+
+    Args:
+        api_args (object): as passed to api
+    Returns:
+        bytes: digest
+    Raises:
+        TypeError: if `api_args` cannot be serialized
+    """
+
+    def _canonical(obj):
+        if isinstance(obj, dict):
+            return msgpack.ExtType(
+                _EXT_CACHE_DICT,
+                p.pack(
+                    sorted(
+                        (
+                            (p.pack(_canonical(k)), _canonical(v))
+                            for k, v in obj.items()
+                        ),
+                        key=lambda x: x[0],
+                    ),
+                ),
+            )
+        if isinstance(obj, (list, tuple)):
+            return [_canonical(x) for x in obj]
+        return obj
+
+    p = msg_packer()
+    return hashlib.sha256(p.pack(_canonical(api_args))).digest()
+
+
+def compression_options(http_config):
+    """Tornado websocket ``compression_options`` from `http_config`
+
+    Args:
+        http_config (PKDict): may contain ``compression_level``
+    Returns:
+        dict: options or None if compression is disabled
+    """
+    if (l := http_config.get("compression_level")) is None:
+        return None
+    if not isinstance(l, int) or not 0 <= l <= 9:
+        raise AssertionError(f"compression_level={l} must be from 0 to 9")
+    return dict(compression_level=l)
+
+
+def subscription(func=None, overflow="wait"):
     """Decorator for api functions thhat can be subscribed by clients.
 
+    May be used with or without arguments::
+
+        @util.subscription
+        async def api_one(self, api_args):
+
+        @util.subscription(overflow="latest")
+        async def api_two(self, api_args):
+
+    A client may limit outstanding results by granting credits (see
+    `pykern.api.client.Client.subscribe_api`). When the client has no
+    credits, ``overflow`` selects what happens: ``wait`` queues up to
+    the initial credits of results (more fails the subscription) and
+    ``subscription.result_send`` waits for a credit; ``latest`` replaces the unsent result so the client only sees the
+    most recent value.
+
     Args:
         func (function): class api
+        overflow (str): ``wait`` or ``latest`` [``wait``]
     Returns:
         function: function to use
     """
 
-    # Give some early feedback
-    if not inspect.iscoroutinefunction(func):
-        raise AssertionError(f"func={func.__name__} must be a coroutine")
-    setattr(func, _SUBSCRIPTION_ATTR, True)
-    return func
+    def _decorator(func):
+        # Give some early feedback
+        if not inspect.iscoroutinefunction(func):
+            raise AssertionError(f"func={func.__name__} must be a coroutine")
+        setattr(func, _SUBSCRIPTION_ATTR, PKDict(overflow=overflow))
+        return func
+
+    if overflow not in SUBSCRIPTION_OVERFLOWS:
+        raise AssertionError(
+            f"overflow={overflow} must be one of {sorted(SUBSCRIPTION_OVERFLOWS)}"
+        )
+    return _decorator if func is None else _decorator(func)
+
+
+def subscription_overflow(func):
+    """What `func` does when client has no credits
+
+    Args:
+        func (function): subscription api
+    Returns:
+        str: member of `SUBSCRIPTION_OVERFLOWS`
+    """
+    return getattr(func, _SUBSCRIPTION_ATTR).overflow
+
+
+def ws_write(protocol, msg, compression_min_size):
+    """Write `msg` compressing only if at least `compression_min_size`
+
+    permessage-deflate (RFC 7692) allows uncompressed messages so small
+    messages skip the compressor. Tornado has no interface for this so
+    the negotiated compressor is unset during the write, which is
+    synchronous up to the frame being queued. See ``test_ws_write`` for
+    the tornado internals relied on.
+
+    Args:
+        protocol (tornado.websocket.WebSocketProtocol): connection
+        msg (bytes): serialized message
+        compression_min_size (int): smaller messages are not compressed
+    Returns:
+        Future: from `write_message`
+    """
+    if protocol is None or protocol.is_closing():
+        raise tornado.websocket.WebSocketClosedError()
+    if (
+        compression_min_size
+        and len(msg) < compression_min_size
+        and (c := getattr(protocol, "_compressor", None))
+    ):
+        protocol._compressor = None
+        try:
+            return protocol.write_message(msg, binary=True)
+        finally:
+            protocol._compressor = c
+    return protocol.write_message(msg, binary=True)
+
+
+def _msg_pack_array(dtype, shape, data):
+    """ExtType for array data
+
+    Args:
+        dtype (str): numpy dtype string, e.g. "<f8"
+        shape (tuple): numpy shape
+        data (object): buffer with raw, C-contiguous data
+    Returns:
+        msgpack.ExtType: serialized array
+    """
+    # join copies data once; ExtType requires bytes
+    return msgpack.ExtType(
+        _EXT_ARRAY,
+        b"".join((msgpack.packb((dtype, shape)), data)),
+    )
+
+
+def _msg_pack_default(obj):
+    if isinstance(obj, datetime.datetime):
+        return int(obj.timestamp())
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    # Subclasses (e.g. numpy.ma.MaskedArray) have semantics lost by raw data
+    if numpy and type(obj) is numpy.ndarray and obj.dtype.kind in _EXT_ARRAY_KINDS:
+        # ascontiguousarray would make 0-d arrays 1-d
+        a = obj if obj.flags.c_contiguous else numpy.ascontiguousarray(obj)
+        return _msg_pack_array(
+            a.dtype.str,
+            obj.shape,
+            a.reshape(-1).view(numpy.uint8),
+        )
+    if isinstance(obj, array.array) and obj.typecode in "bBhHiIlLqQfd":
+        return _msg_pack_array(
+            _NATIVE_BYTE_ORDER
+            + ("f" if obj.typecode in "fd" else "i" if obj.typecode.islower() else "u")
+            + str(obj.itemsize),
+            (len(obj),),
+            obj,
+        )
+    if hasattr(obj, "tolist"):
+        # tolist works with pandas and numpy. If tolist takes
+        # params or not a callable, then the result will be the
+        # essentially the same as not having this code.
+        return obj.tolist()
+    return obj
+
+
+def _msg_unpack_array(dtype, shape, data):
+    """Convert raw array data to nested lists when numpy is not available"""
+
+    def _nest(values, shape):
+        if len(shape) <= 1:
+            return values
+        n = _size(shape[1:])
+        return [_nest(values[i * n : (i + 1) * n], shape[1:]) for i in range(shape[0])]
+
+    def _size(shape):
+        rv = 1
+        for x in shape:
+            rv *= x
+        return rv
+
+    o = dtype[0]
+    if o not in "<>":
+        o = _NATIVE_BYTE_ORDER
+    f = _STRUCT_FORMAT.get(dtype[1:])
+    if f is None:
+        raise APIProtocolError(f"unsupported array dtype={dtype}")
+    n = _size(shape)
+    c = dtype[1] == "c"
+    rv = list(struct.unpack(f"{o}{n * (2 if c else 1)}{f}", data))
+    if c:
+        rv = [complex(rv[i], rv[i + 1]) for i in range(0, len(rv), 2)]
+    if not shape:
+        return rv[0]
+    return _nest(rv, shape)
+
+
+def _msg_unpack_ext(code, data):
+    if code != _EXT_ARRAY:
+        return msgpack.ExtType(code, data)
+    u = msgpack.Unpacker()
+    u.feed(data)
+    d, s = u.unpack()
+    o = u.tell()
+    if numpy:
+        # Zero copy so the array is read-only
+        return numpy.frombuffer(data, dtype=d, offset=o).reshape(tuple(s))
+    return _msg_unpack_array(d, s, memoryview(data)[o:])
@@ -151,16 +151,34 @@ Just quote with single quotes::
 
   a: 'c({"d": "e"})'
 
+Result Cache
+------------
+
+If ``PYKERN_FCONF_CACHE_DIR`` is set, `parse_all` stores its result
+keyed by a digest of the contents and names of all input files and
+``base_vars``. When none of those change, the result is loaded from
+the cache without evaluation. Python macro files are only digested
+themselves so modules they import or environment they read are not
+part of the key. Use ``pykern fconf cache-clear`` if that matters.
+``pykern fconf cache-info`` shows the state of the cache.
+
 :copyright: Copyright (c) 2022 RadiaSoft LLC.  All Rights Reserved.
 :license: http://www.apache.org/licenses/LICENSE-2.0.html
 
 """
 
+from pykern import pkconfig
 from pykern.pkcollections import PKDict
-from pykern.pkdebug import pkdc, pkdlog, pkdp
+from pykern.pkdebug import pkdc, pkdexc, pkdlog, pkdp
+import concurrent.futures
 import contextlib
 import copy
+import hashlib
 import inspect
+import multiprocessing
+import os
+import pickle
+import pykern.pkjson
 import pykern.pkrunpy
 import re
 import pykern.pkyaml
@@ -192,46 +210,94 @@ _NO_PARAM = object()
 
 _BUILTINS_EXT = "builtins"
 
+#: Suffix for result cache files
+_CACHE_EXT = ".pickle"
+
+#: In process counts of result cache lookups
+_cache_stats = PKDict(hits=0, misses=0, stores=0)
+
 
 class Parser(PKDict):
-    def __init__(self, files, base_vars=None):
+    """Parse and evaluate `files` into `result`
+
+    If ``load_processes`` is greater than one, YAML files are parsed
+    concurrently in a process pool. The YAML parser is pure Python so
+    threads would be serialized by the GIL. The pool is only worth its
+    startup cost for many or large files. Workers are spawned, so the
+    main program must be guarded by ``if __name__ == "__main__"``. Macro registration and
+    evaluation still happen in the order of `files`.
+
+    `refresh` re-parses only the files whose mtime or size changed. If
+    `incremental` is true, the values after each YAML file are saved so
+    that `refresh` only re-evaluates the first changed YAML file and
+    the files after it, which may depend on it. A change to any Python
+    file or to ``fconf_macros`` re-evaluates everything.
+
+    Args:
+        files (list): py.path of ``.py`` and ``.yml`` files
+        base_vars (PKDict): initial variable state [None]
+        incremental (bool): save state for `refresh` [False]
+    """
+
+    def __init__(self, files, base_vars=None, incremental=False):
         self.pkupdate(
             files=PKDict(),
             macros=PKDict(),
+            _base_vars=base_vars,
+            _incremental=incremental,
         )
-        self._add_file(pykern.pkio.py_path(f"fconf.{_BUILTINS_EXT}"))
-        for f in files:
-            try:
-                self._add_file(f)
-            except Exception as e:
-                pykern.pkinspect.append_exception_reason(e, f"fconf.Parser.file={f}")
-                raise
+        self._sources = [
+            self._file(pykern.pkio.py_path(f"fconf.{_BUILTINS_EXT}"))
+        ] + self._read(files)
+        self._register()
         if "yml" not in self.files:
             raise ValueError("must supply at least one '.yml' file")
-        e = _Evaluator(
-            global_fvars=PKDict() if base_vars is None else copy.deepcopy(base_vars),
-            parser=self,
-        )
-        for f in self.files.yml:
-            e.start(source=f)
-        self.result = e.global_fvars
+        self._evaluate(0)
 
-    def _add_file(self, path):
-        e = path.ext[1:].lower()
-        if e == "yaml":
-            e = "yml"
-        f = _File(
-            content=getattr(self, f"_ext_{e}")(path),
-            ext=e,
-            path=path,
+    def refresh(self):
+        """Re-parse changed files and re-evaluate what depends on them
+
+        The set of files is fixed by the constructor.
+
+        Returns:
+            bool: True if any file changed and `result` was recomputed
+        """
+        c = [
+            i
+            for i, f in enumerate(self._sources)
+            if f.ext != _BUILTINS_EXT and f.stamp != _stamp(f.path)
+        ]
+        if not c:
+            return False
+        s = list(self._sources)
+        for i, f in zip(c, self._read([s[i].path for i in c])):
+            s[i] = f
+        m = any(
+            s[i].ext != "yml" or s[i].text_macros != self._sources[i].text_macros
+            for i in c
+        )
+        self._sources = s
+        self._register()
+        self._evaluate(
+            (
+                0
+                if m or not self._incremental
+                else next(
+                    i for i, f in enumerate(self.files.yml) if any(f is s[j] for j in c)
+                )
+            ),
         )
+        return True
+
+    def _add_file(self, source):
+        e = source.ext
         if e in ("py", _BUILTINS_EXT):
-            self._add_macros(f)
+            self._add_macros(source)
         elif e == "yml":
-            self._add_text_macros(f)
+            self._add_text_macros(source)
         else:
             raise ValueError(f"unhandled file ext={e}")
-        self.files.setdefault(e, []).append(f)
+        self.files.setdefault(e, []).append(source)
 
     def _add_macro(self, macro):
         n = macro.name
@@ -257,7 +323,7 @@ class Parser(PKDict):
             )
 
     def _add_text_macros(self, source):
-        m = source.content.pkdel("fconf_macros")
+        m = source.text_macros
         if not m:
             return
         for n, c in m.items():
@@ -277,6 +343,21 @@ class Parser(PKDict):
                 ),
             )
 
+    def _evaluate(self, start):
+        """Evaluate yml files from index `start` on"""
+        y = self.files.yml
+        if start == 0:
+            g = self._base_vars
+            g = PKDict() if g is None else copy.deepcopy(g)
+        else:
+            g = copy.deepcopy(y[start - 1].fvars)
+        e = _Evaluator(global_fvars=g, parser=self)
+        for f in y[start:]:
+            e.start(source=f)
+            if self._incremental:
+                f.fvars = copy.deepcopy(e.global_fvars)
+        self.result = e.global_fvars
+
     def _ext_builtins(self, path):
         return self._functions(_Builtins)
 
@@ -288,6 +369,26 @@ class Parser(PKDict):
     def _ext_yml(self, path):
         return pykern.pkyaml.load_file(path)
 
+    def _file(self, path, loaded=None):
+        e = _ext(path)
+        if loaded:
+            t, c = loaded
+        else:
+            # stat before reading so a concurrent change is seen by refresh
+            t = _stamp(path) if e != _BUILTINS_EXT else None
+            c = getattr(self, f"_ext_{e}")(path)
+        return _File(
+            content=c,
+            ext=e,
+            path=path,
+            stamp=t,
+            text_macros=(
+                c.pkdel("fconf_macros")
+                if e == "yml" and isinstance(c, PKDict)
+                else None
+            ),
+        )
+
     def _functions(self, obj, co_filename=None):
         import types
 
@@ -300,6 +401,76 @@ class Parser(PKDict):
                 m[n] = o
         return m
 
+    def _read(self, paths):
+        """Parse files, YAML in a process pool if configured
+
+        Returns:
+            list: `_File` in the order of `paths`
+        """
+
+        def _results(pool):
+            f = [
+                # stat before reading so a concurrent change is seen by refresh
+                (_stamp(p), pool.submit(_load_yml, p)) if _ext(p) == "yml" else None
+                for p in paths
+            ]
+            for p, x in zip(paths, f):
+                try:
+                    yield self._file(p, x and (x[0], x[1].result()))
+                except Exception as e:
+                    pykern.pkinspect.append_exception_reason(
+                        e, f"fconf.Parser.file={p}"
+                    )
+                    raise
+
+        if _cfg.load_processes > 1 and sum(_ext(p) == "yml" for p in paths) > 1:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=_cfg.load_processes,
+                # forking a process which may have threads can deadlock
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as p:
+                return list(_results(p))
+        return [self._file(p) for p in paths]
+
+    def _register(self):
+        self.files = PKDict()
+        self.macros = PKDict()
+        for f in self._sources:
+            try:
+                self._add_file(f)
+            except Exception as e:
+                pykern.pkinspect.append_exception_reason(
+                    e, f"fconf.Parser.file={f.path}"
+                )
+                raise
+
+
+def cache_clear():
+    """Remove all entries in the result cache
+
+    Returns:
+        int: number of entries removed
+    """
+    rv = 0
+    for f in _cache_entries():
+        pykern.pkio.unchecked_remove(f)
+        rv += 1
+    return rv
+
+
+def cache_info():
+    """State of the result cache
+
+    Returns:
+        PKDict: dir, entries, bytes, and in process hits, misses, stores
+    """
+    e = _cache_entries()
+    return PKDict(
+        dir=_cfg.cache_dir and str(_cfg.cache_dir),
+        entries=len(e),
+        bytes=sum(f.size() for f in e),
+    ).pkupdate(_cache_stats)
+
 
 def parse_all(path, base_vars=None, glob="*"):
     """Parse all the Python and YAML files in `directory`
@@ -307,6 +478,8 @@ def parse_all(path, base_vars=None, glob="*"):
     Files are read in sorted order with all Python files first and
     YAML files next. YAML file evaluation happens in that same order.
 
+    The result is cached if ``cache_dir`` is configured (see module doc).
+
     Args:
         path (py.path): directory that ``*.py`` and ``*.yml`` files
         base_vars (PKDict): initial variable state. May be hierarchical. [None]
@@ -319,7 +492,14 @@ def parse_all(path, base_vars=None, glob="*"):
         return pykern.pkio.sorted_glob(path.join(f"{glob}.{ext}"))
 
     # yml & yaml need to be sorted together
-    return Parser(_glob("py") + sorted(_glob("yml") + _glob("yaml"))).result
+    f = _glob("py") + sorted(_glob("yml") + _glob("yaml"))
+    k = _cache_key(f, base_vars)
+    if k and (rv := _cache_get(k)) is not None:
+        return rv
+    rv = Parser(f, base_vars=base_vars).result
+    if k:
+        _cache_put(k, rv)
+    return rv
 
 
 class _Builtins:
@@ -328,6 +508,70 @@ class _Builtins:
         return namespace._evaluator.fconf_var(name)
 
 
+def _cache_entries():
+    if not _cfg.cache_dir or not _cfg.cache_dir.exists():
+        return []
+    return pykern.pkio.sorted_glob(_cfg.cache_dir.join("*" + _CACHE_EXT))
+
+
+def _cache_get(key):
+    p = _cfg.cache_dir.join(key + _CACHE_EXT)
+    try:
+        with open(p, "rb") as f:
+            rv = pickle.load(f)
+        _cache_stats.hits += 1
+        return rv
+    except Exception as e:
+        if not pykern.pkio.exception_is_not_found(e):
+            pkdlog("ignoring corrupt cache={} error={}", p, e)
+    _cache_stats.misses += 1
+    return None
+
+
+def _cache_key(files, base_vars):
+    """Digest of inputs to `Parser` or None if no cache"""
+    if not _cfg.cache_dir:
+        return None
+    h = hashlib.sha256(pykern.pkio.read_binary(__file__))
+    for f in files:
+        h.update(str(f).encode() + b"\0")
+        h.update(hashlib.sha256(pykern.pkio.read_binary(f)).digest())
+    h.update(pykern.pkjson.dump_bytes(base_vars, sort_keys=True))
+    return h.hexdigest()
+
+
+def _cache_put(key, result):
+    try:
+        pykern.pkio.mkdir_parent(_cfg.cache_dir)
+        pykern.pkio.atomic_write(
+            _cfg.cache_dir.join(key + _CACHE_EXT),
+            pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL),
+            mode="wb",
+        )
+        _cache_stats.stores += 1
+    except Exception as e:
+        pkdlog("unable to cache result key={} error={} {}", key, e, pkdexc())
+
+
+def _cfg_cache_dir(value):
+    return pykern.pkio.py_path(value)
+
+
+def _ext(path):
+    rv = path.ext[1:].lower()
+    return "yml" if rv == "yaml" else rv
+
+
+def _load_yml(path):
+    # process pool worker so must be module level
+    return pykern.pkyaml.load_file(path)
+
+
+def _stamp(path):
+    s = os.stat(str(path))
+    return (s.st_mtime_ns, s.st_size)
+
+
 class _Evaluator(PKDict):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -336,6 +580,10 @@ class _Evaluator(PKDict):
         self.global_ns = PKDict()
         self.local_ns = _Namespace(self)
         self.local_fvars = PKDict()
+        # Compiled forms of expressions by source. Macros are
+        # fixed once evaluation starts so cached calls stay valid.
+        self._exprs = PKDict()
+        self._calls = PKDict()
 
     def fconf_var(self, name):
         try:
@@ -401,32 +649,50 @@ class _Evaluator(PKDict):
         return self._expr(new)
 
     def _expr(self, value):
-        def _fvar_op(match, native=False, use_repr=False):
-            n = match.group(1)
-            if n in self.local_fvars:
-                res = self.local_fvars[n]
-            else:
-                res = self.fconf_var(n)
-            if use_repr:
-                return repr(res)
-            return res if native else str(res)
+        def _fvar_op(name):
+            if name in self.local_fvars:
+                return self.local_fvars[name]
+            return self.fconf_var(name)
 
-        def _fvar_sub(value, use_repr=False):
+        def _fvar_sub(value):
             with self._xpath(value):
-                m = None if use_repr else _FVAR_EXACT.search(value)
-                # This check prevents stringification of data types on exact
-                # matches, which is important for non-string fvars
-                if m:
-                    res = _fvar_op(m, native=True)
+                c = self._exprs.get(value)
+                if c is None:
+                    c = self._exprs[value] = _Expr(value)
+                if c.exact is not None:
+                    res = _fvar_op(c.exact)
+                    # This check prevents stringification of data types on exact
+                    # matches, which is important for non-string fvars
                     if not isinstance(res, str):
                         # already canonicalized
                         return True, res
-                else:
-                    res = _FVAR.sub(
-                        lambda x: _fvar_op(x, use_repr=use_repr),
-                        value,
-                    )
-                return False, res
+                    return False, res
+                if c.parts is None:
+                    return False, value
+                p = list(c.parts)
+                for i in range(1, len(p), 2):
+                    p[i] = str(_fvar_op(p[i]))
+                return False, "".join(p)
+
+        def _call(value):
+            """Compiled macro call or None if not a call"""
+            if value in self._calls:
+                return self._calls[value]
+            m = _MACRO_CALL.search(value)
+            if not m:
+                self._calls[value] = None
+                return None
+            a = m.group(2)
+            if _FVAR.search(a):
+                # substitution produced an fvar so can't cache
+                return m
+            s = f"{_SELF}," if m.group(1) in self.parser.macros else ""
+            rv = self._calls[value] = _compile_call(m.group(1), s, a)
+            return rv
+
+        def _compile_call(name, self_arg, args):
+            v = f"{name}({self_arg}{args})"
+            return PKDict(source=v, code=compile(v, "<string>", "eval"))
 
         if not isinstance(value, str):
             # already canonicalized
@@ -435,16 +701,19 @@ class _Evaluator(PKDict):
         if k:
             return v
         with self._xpath(v):
-            m = _MACRO_CALL.search(v)
-        if not m:
+            c = _call(v)
+        if not c:
             return v
         with self._xpath(v):
-            a = _fvar_sub(m.group(2))[1] if len(m.group(2)) > 0 else ""
-            s = f"{_SELF}," if m.group(1) in self.parser.macros else ""
-            v = f"{m.group(1)}({s}{a})"
-            with self._xpath(v):
+            if not isinstance(c, PKDict):
+                c = _compile_call(
+                    c.group(1),
+                    f"{_SELF}," if c.group(1) in self.parser.macros else "",
+                    _fvar_sub(c.group(2))[1],
+                )
+            with self._xpath(c.source):
                 return pykern.pkcollections.canonicalize(
-                    eval(v, self.global_ns, self.local_ns),
+                    eval(c.code, self.global_ns, self.local_ns),
                 )
 
     def _list(self, new, base):
@@ -479,6 +748,21 @@ class _Evaluator(PKDict):
             yield
 
 
+class _Expr:
+    """Value parsed once into fvar substitution slots
+
+    ``exact`` is the fvar name if the value is only an fvar. Otherwise,
+    ``parts`` alternates literal text and fvar names (odd indices) or
+    is None if there are no fvars.
+    """
+
+    def __init__(self, value):
+        m = _FVAR_EXACT.search(value)
+        self.exact = m.group(1) if m else None
+        p = _FVAR.split(value)
+        self.parts = None if len(p) == 1 else tuple(p)
+
+
 class _File(PKDict):
     def __str__(self):
         return "source=" + pykern.pkio.py_path().bestrelpath(self.path)
@@ -604,3 +888,13 @@ class _YAMLMacro(PKDict):
 
     def __str__(self):
         return f"macro={self.name}"
+
+
+_cfg = pkconfig.init(
+    cache_dir=(None, _cfg_cache_dir, "directory to cache results of parse_all"),
+    load_processes=(
+        1,
+        pkconfig.parse_positive_int,
+        "processes used by Parser to parse YAML files concurrently (1 is serial)",
+    ),
+)
@@ -16,10 +16,12 @@ import asyncio
 import inspect
 import queue
 import re
+import socket
 import threading
 import tornado.gen
 import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
 import tornado.web
 
 _cfg = None
@@ -247,24 +249,33 @@ class Loop:
         ``http_config.uri_map`` maps URI expressions to classes, which
         is passed directly to `tornado.web.Application`.
 
+        If ``http_config.unix_socket`` is set, the server listens on
+        that Unix domain socket path instead of ``tcp_ip`` and
+        ``tcp_port``.
+
         Args:
-            http_cfg (PKDict): quest_start, uri_map, debug, tcp_ip, tcp_port,
+            http_cfg (PKDict): quest_start, uri_map, debug, tcp_ip, tcp_port, unix_socket
 
         """
 
         async def _do():
             # TODO(e-carlin): pull in the one in job_supervisor.py
-            p = http_cfg.get("tcp_port", _cfg.server_port)
-            i = http_cfg.get("tcp_ip", _cfg.server_ip)
-            tornado.httpserver.HTTPServer(
+            s = tornado.httpserver.HTTPServer(
                 tornado.web.Application(
                     http_cfg.uri_map,
                     debug=http_cfg.get("debug", _cfg.debug),
                     log_function=http_cfg.get("log_function", self.http_log),
                 ),
                 xheaders=True,
-            ).listen(p, i)
-            pkdlog("name={} ip={} port={}", http_cfg.get("name"), i, p)
+            )
+            if u := http_cfg.get("unix_socket"):
+                s.add_socket(tornado.netutil.bind_unix_socket(str(u)))
+                pkdlog("name={} unix_socket={}", http_cfg.get("name"), u)
+            else:
+                p = http_cfg.get("tcp_port", _cfg.server_port)
+                i = http_cfg.get("tcp_ip", _cfg.server_ip)
+                s.listen(p, i)
+                pkdlog("name={} ip={} port={}", http_cfg.get("name"), i, p)
             await asyncio.Event().wait()
 
         if self.__http_server:
@@ -301,6 +312,8 @@ class Loop:
         if c := request.connection:
             # socket is not set on stream for websockets.
             if getattr(c, "stream", None) and (s := getattr(c.stream, "socket", None)):
+                if s.family == socket.AF_UNIX:
+                    return "unix:0"
                 return "{}:{}".format(*s.getpeername())
         i = request.headers.get("proxy-for", request.remote_ip)
         return f"{i}:0"
@@ -0,0 +1,32 @@
+"""manage `pykern.fconf` result cache
+
+:copyright: Copyright (c) 2026 RadiaSoft LLC.  All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+from pykern.pkdebug import pkdc, pkdlog, pkdp
+import pykern.fconf
+import pykern.pkjson
+
+
+def cache_clear():
+    """Remove all entries in the result cache
+
+    Returns:
+        str: number of entries removed
+    """
+    return f"removed entries={pykern.fconf.cache_clear()}"
+
+
+def cache_info():
+    """Display the state of the result cache
+
+    Returns:
+        str: dir, entries, and bytes as JSON
+    """
+    rv = pykern.fconf.cache_info()
+    if not rv.dir:
+        return "cache disabled; set PYKERN_FCONF_CACHE_DIR"
+    return pykern.pkjson.dump_pretty(
+        {k: rv[k] for k in ("dir", "entries", "bytes")}
+    ).rstrip()
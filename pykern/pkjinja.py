@@ -1,47 +1,92 @@
 # -*- coding: utf-8 -*-
 """Simplify rendering jinja2
 
+Environments are cached by their options and compiled templates are
+cached by path, mtime, and size so repeated renders of the same file
+only pay for `jinja2.Template.render`. Set
+``PYKERN_PKJINJA_BYTECODE_CACHE_DIR`` to share compiled templates
+across processes.
+
 :copyright: Copyright (c) 2015 RadiaSoft LLC.  All Rights Reserved.
 :license: http://www.apache.org/licenses/LICENSE-2.0.html
 """
 from __future__ import absolute_import, division, print_function
+from pykern import pkconfig
 from pykern import pkinspect
 from pykern import pkio
 from pykern import pkresource
+from pykern.pkcollections import PKDict
 from pykern.pkdebug import pkdc, pkdp
+import hashlib
 import jinja2
+import os
 
 
 #: Implicit extension including '.' added to resources
 RESOURCE_SUFFIX = ".jinja"
 
+#: `jinja2.Environment` by `_env_key`
+_envs = {}
+
+#: (env key, path) to ((mtime, size), `jinja2.Template`)
+_templates = {}
+
+_stats = None
+
+
+def cache_stats():
+    """Counts of environment and template cache hits and misses
+
+    Returns:
+        PKDict: env_hits, env_misses, template_hits, template_misses, templates
+    """
+    return _stats.copy().pkupdate(templates=len(_templates))
 
-def render_file(filename, j2_ctx, output=None, strict_undefined=False, jinja_env=None):
+
+def clear_cache():
+    """Discard cached environments, templates, and statistics"""
+    global _stats
+
+    _envs.clear()
+    _templates.clear()
+    _stats = PKDict(env_hits=0, env_misses=0, template_hits=0, template_misses=0)
+
+
+def render_file(
+    filename,
+    j2_ctx,
+    output=None,
+    strict_undefined=False,
+    jinja_env=None,
+    stream=False,
+):
     """Render filename as template with j2_ctx.
 
+    With `stream`, the rendered output is written to `output` as it is
+    generated (`jinja2.Template.generate`) so the whole document is never
+    held in memory. `output` is replaced with `pkio.atomic_write`.
+
     Args:
         basename (str): name without jinja extension
         j2_ctx (dict): how to replace values in Jinja2 template
         output (str): file name of output; if None, return str
         strict_undefined (bool): set `jinja2.StrictUndefined` if True
         jinja_env (dict): add values to jinja2 environment
+        stream (bool): write to `output` incrementally and return None [False]
 
     Returns:
-        str: rendered template
+        str: rendered template (None if `stream`)
     """
-    t = pkio.read_text(filename)
-    kw = dict(
-        trim_blocks=True,
-        lstrip_blocks=True,
-        keep_trailing_newline=True,
-        extensions=["jinja2.ext.do"],
-    )
-    if strict_undefined:
-        kw["undefined"] = jinja2.StrictUndefined
-    if jinja_env:
-        kw.update(jinja_env)
-    je = jinja2.Environment(**kw)
-    res = je.from_string(t).render(j2_ctx)
+    t = _template(str(filename), strict_undefined, jinja_env)
+    if stream:
+        if not output:
+            raise AssertionError("stream requires output")
+        pkio.atomic_write(
+            output,
+            writer=lambda p: t.stream(j2_ctx).dump(str(p), encoding=pkio.TEXT_ENCODING),
+        )
+        return None
+    res = t.render(j2_ctx)
     if output:
         pkio.write_text(output, res)
     return res
@@ -60,5 +105,121 @@ def render_resource(basename, *args, **kwargs):
             pkinspect.caller_module(),
         ),
         *args,
-        **kwargs
+        **kwargs,
     )
+
+
+class _PathLoader(jinja2.BaseLoader):
+    """Loads templates by absolute path so `bytecode_cache` is used"""
+
+    def get_source(self, environment, template):
+        return (pkio.read_text(template), template, None)
+
+
+def _bytecode_cache(key):
+    """Cache in `bytecode_cache_dir` unique to the environment's options
+
+    jinja2 only checks the template source when loading bytecode so
+    the options (always literals, see `_env_key`) must be part of the
+    file name.
+    """
+    if not _cfg.bytecode_cache_dir:
+        return None
+    return jinja2.FileSystemBytecodeCache(
+        str(pkio.mkdir_parent(_cfg.bytecode_cache_dir)),
+        pattern="__jinja2_%s_"
+        + hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        + ".cache",
+    )
+
+
+@pkconfig.parse_none
+def _cfg_bytecode_cache_dir(value):
+    if value is None:
+        return None
+    return pkio.py_path(value)
+
+
+def _env(strict_undefined, jinja_env, key):
+    kw = dict(
+        trim_blocks=True,
+        lstrip_blocks=True,
+        keep_trailing_newline=True,
+        extensions=["jinja2.ext.do"],
+    )
+    if strict_undefined:
+        kw["undefined"] = jinja2.StrictUndefined
+    if key is not None:
+        kw["loader"] = _PathLoader()
+        if c := _bytecode_cache(key):
+            kw["bytecode_cache"] = c
+    if jinja_env:
+        kw.update(jinja_env)
+    return jinja2.Environment(**kw)
+
+
+def _env_key(strict_undefined, jinja_env):
+    """Hashable key for the options or None if not cacheable
+
+    Options which are not literals (e.g. functions) are not cached,
+    because they are usually created per call so would grow `_envs`
+    without bound and cannot be represented stably across processes.
+    """
+
+    def _freeze(value):
+        if isinstance(value, dict):
+            return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(_freeze(v) for v in value)
+        return value
+
+    if jinja_env and "loader" in jinja_env:
+        # caller's loader may resolve includes so can't be replaced
+        return None
+    rv = (bool(strict_undefined), _freeze(jinja_env or {}))
+    return rv if _is_literal(rv) else None
+
+
+def _is_literal(value):
+    if isinstance(value, tuple):
+        return all(_is_literal(v) for v in value)
+    return value is None or isinstance(value, (bool, int, float, str))
+
+
+def _template(path, strict_undefined, jinja_env):
+    k = _env_key(strict_undefined, jinja_env)
+    if k is None:
+        return _env(strict_undefined, jinja_env, k).from_string(pkio.read_text(path))
+    if (e := _envs.get(k)) is None:
+        _stats.env_misses += 1
+        e = _envs[k] = _env(strict_undefined, jinja_env, k)
+    else:
+        _stats.env_hits += 1
+    s = os.stat(path)
+    m = (s.st_mtime_ns, s.st_size)
+    if (t := _templates.get((k, path))) and t[0] == m:
+        _stats.template_hits += 1
+        return t[1]
+    _stats.template_misses += 1
+    _templates.pop((k, path), None)
+    if len(_templates) >= _cfg.max_templates:
+        # dicts are ordered so this is the first compiled (FIFO)
+        del _templates[next(iter(_templates))]
+    rv = e.loader.load(e, path, e.make_globals(None))
+    _templates[(k, path)] = (m, rv)
+    return rv
+
+
+_cfg = pkconfig.init(
+    bytecode_cache_dir=(
+        None,
+        _cfg_bytecode_cache_dir,
+        "directory for jinja2.FileSystemBytecodeCache shared across processes",
+    ),
+    max_templates=(
+        256,
+        pkconfig.parse_positive_int,
+        "maximum number of compiled templates kept in memory",
+    ),
+)
+clear_cache()
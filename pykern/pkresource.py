@@ -9,6 +9,7 @@ from pykern import pkconst
 from pykern import pkinspect
 from pykern import pkio
 import errno
+import fnmatch
 import glob
 import importlib
 import os.path
@@ -16,6 +17,12 @@ import sys
 
 from pykern.pkdebug import pkdp
 
+#: Maps root package name to its `_PackageIndex`
+_index = {}
+
+#: Maps names passed in `packages` to root package names
+_root_packages = {}
+
 if sys.version_info < (3, 10):
     # There's a bug resources.files() in 3.9.15 so need this.
     # Also works with older versions than 3.9
@@ -36,6 +43,25 @@ else:
         )
 
 
+def clear_index(packages=None):
+    """Forget cached package_data contents
+
+    Resources are indexed lazily, one directory at a time, and the index
+    is never refreshed, except in dev mode (see `pykern.pkconfig.in_dev_mode`),
+    where directories are revalidated by mtime. Dev mode is only checked
+    after pkconfig has been initialized by some other module. Call this if package_data
+    is modified by a running program.
+
+    Args:
+        packages (List[str]): root packages to clear [all]
+    """
+    if packages is None:
+        _index.clear()
+        return
+    for p in packages:
+        _index.pop(_root_package(p), None)
+
+
 def file_path(relative_filename, caller_context=None, packages=None):
     """Return the path to the resource
 
@@ -65,9 +91,9 @@ def filename(relative_filename, caller_context=None, packages=None):
         relative_filename
     ), "must not be an absolute file name={}".format(relative_filename)
     a = []
-    for f, p in _files(relative_filename, caller_context, packages):
-        a.append(p)
-        if os.path.exists(f):
+    for i in _indices(caller_context, packages):
+        a.append(i.package)
+        if f := i.filename(relative_filename):
             return f
     _raise_no_file_found(a, relative_filename)
 
@@ -83,32 +109,124 @@ def glob_paths(relative_path, caller_context=None, packages=None):
         py.path: absolute paths of the matched files
     """
     r = []
-    for f, p in _files(relative_path, caller_context, packages):
-        r.extend(glob.glob(f))
+    for i in _indices(caller_context, packages):
+        r.extend(i.glob(relative_path))
     return [pkio.py_path(f) for f in r]
 
 
-def _files(path, caller_context, packages):
+class _PackageIndex:
+    """Lazily populated listing of a root package's package_data directory
+
+    Each directory is listed once on first access. In dev mode, a
+    directory is relisted when its mtime changes.
+    """
 
+    def __init__(self, package):
+        self.package = package
+        self._root = os.path.normpath(_resource_filename(package, ""))
+        self._dirs = {}
+
+    def filename(self, path):
+        """Absolute path if `path` exists in package_data
+
+        Args:
+            path (str): relative to package_data
+        Returns:
+            str: absolute path or None
+        """
+        n = os.path.normpath(path)
+        f = os.path.join(self._root, path)
+        if n == os.curdir:
+            return f if self._entries(n) is not None else None
+        if n.startswith(os.pardir):
+            # outside package_data so not indexed
+            return f if os.path.exists(f) else None
+        d, b = os.path.split(n)
+        return f if b in (self._entries(d) or ()) else None
+
+    def glob(self, pattern):
+        """Paths matching pattern with `glob.glob` semantics
+
+        Args:
+            pattern (str): relative to package_data
+        Returns:
+            list: absolute paths
+        """
+
+        def _match(parent, parts):
+            e = self._entries(parent)
+            if not e:
+                return
+            p = parts[0]
+            if glob.has_magic(p):
+                n = fnmatch.filter(
+                    e if p.startswith(".") else (x for x in e if x[0] != "."),
+                    p,
+                )
+            elif p in e:
+                n = [p]
+            else:
+                return
+            for x in n:
+                r = os.path.join(parent, x)
+                if len(parts) == 1:
+                    yield r
+                elif e[x]:
+                    yield from _match(r, parts[1:])
+
+        n = os.path.normpath(pattern)
+        if n == os.curdir or n.startswith(os.pardir):
+            return glob.glob(os.path.join(self._root, pattern))
+        return [os.path.join(self._root, x) for x in _match("", n.split(os.sep))]
+
+    def _entries(self, directory):
+        """Names in directory mapped to whether they are directories
+
+        Args:
+            directory (str): normalized path relative to package_data
+        Returns:
+            dict: names to bool or None if not a directory
+        """
+        k = "" if directory == os.curdir else directory
+        p = os.path.join(self._root, k)
+        d = _is_dev_mode()
+        if (rv := self._dirs.get(k)) is not None and not d:
+            return rv[1]
+        try:
+            m = os.stat(p).st_mtime_ns if d else None
+            if rv is not None and rv[0] == m:
+                return rv[1]
+            with os.scandir(p) as i:
+                e = {x.name: x.is_dir() for x in i}
+        except (FileNotFoundError, NotADirectoryError):
+            m = e = None
+        self._dirs[k] = (m, e)
+        return e
+
+
+def _indices(caller_context, packages):
     if caller_context and packages:
         raise ValueError(
             f"Use only one of caller_context={caller_context} and packages={packages}",
         )
-    for p in list(
-        map(
-            lambda m: pkinspect.root_package(importlib.import_module(m)),
-            packages
-            or [
-                pkinspect.root_package(
-                    caller_context if caller_context else pkinspect.caller_module()
-                )
-            ],
-        )
+    for p in (
+        map(_root_package, packages)
+        if packages
+        else [
+            pkinspect.root_package(
+                caller_context if caller_context else pkinspect.caller_module()
+            )
+        ]
     ):
-        yield (
-            _resource_filename(p, path),
-            p,
-        )
+        if (rv := _index.get(p)) is None:
+            rv = _index[p] = _PackageIndex(p)
+        yield rv
+
+
+def _is_dev_mode():
+    # Importing pkconfig here would initialize config too early
+    c = sys.modules.get("pykern.pkconfig")
+    return c is not None and c.cfg is not None and c.cfg.dev_mode
 
 
 def _raise_no_file_found(packages, path):
@@ -116,3 +234,11 @@ def _raise_no_file_found(packages, path):
     if "__main__" in packages:
         msg += "; do not call module as a program"
     raise IOError(errno.ENOENT, msg, path)
+
+
+def _root_package(name):
+    if (rv := _root_packages.get(name)) is None:
+        rv = _root_packages[name] = pkinspect.root_package(
+            importlib.import_module(name)
+        )
+    return rv
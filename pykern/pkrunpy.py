@@ -1,15 +1,42 @@
 # -*- coding: utf-8 -*-
 """Run python code
 
+Compiled code is memoized in process and, if
+``PYKERN_PKRUNPY_CODE_CACHE_DIR`` is set, marshalled to disk in the
+same layout as a pyc file (PEP 552). Cache entries are validated like
+`importlib` does: by source mtime and size (``timestamp``) or by
+`importlib.util.source_hash` (``checked_hash``).
+
 :copyright: Copyright (c) 2015 RadiaSoft LLC.  All Rights Reserved.
 :license: http://www.apache.org/licenses/LICENSE-2.0.html
 """
 # Avoid pykern imports so avoid dependency issues
+import hashlib
 import importlib.machinery
 import importlib.util
+import marshal
 import os.path
 import sys
 
+#: Values for ``code_cache_check``
+CODE_CACHE_CHECKS = frozenset(("checked_hash", "timestamp"))
+
+#: (absolute path, path) to (validation key, code)
+_memo = {}
+
+_cfg = None
+
+
+def clear_cache():
+    """Forget memoized code and reinitialize config on next call
+
+    The disk cache is not modified.
+    """
+    global _cfg
+
+    _memo.clear()
+    _cfg = None
+
 
 def run_path_as_module(fname):
     """Runs ``fname`` in a module
@@ -23,7 +50,111 @@ def run_path_as_module(fname):
     fname = str(fname)
     mn = os.path.basename(fname).replace(".", "_")
     m = importlib.util.module_from_spec(importlib.machinery.ModuleSpec(mn, None))
-    with open(fname, "rt") as f:
-        code = compile(f.read(), fname, "exec")
-    exec(code, m.__dict__)
+    exec(_code(fname), m.__dict__)
     return m
+
+
+def _cache_path(fname):
+    # fname is part of the key, because it is compiled into co_filename
+    return os.path.join(
+        _cfg.code_cache_dir,
+        hashlib.sha1(f"{os.path.abspath(fname)}\0{fname}".encode()).hexdigest()
+        + importlib.machinery.BYTECODE_SUFFIXES[0],
+    )
+
+
+def _cfg_code_cache_check(value):
+    from pykern import pkconfig
+
+    if value not in CODE_CACHE_CHECKS:
+        pkconfig.raise_error(f"must be one of {sorted(CODE_CACHE_CHECKS)}")
+    return value
+
+
+def _code(fname):
+    """Compile fname or return cached code
+
+    Args:
+        fname (str): python file
+    Returns:
+        code: compiled code object
+    """
+    _init()
+    s = None
+    if _cfg.code_cache_check == "checked_hash":
+        s = _read(fname)
+        k = importlib.util.source_hash(s)
+        h = (0b11).to_bytes(4, "little") + k
+    else:
+        x = os.stat(fname)
+        k = (x.st_mtime_ns, x.st_size)
+        h = (
+            (0).to_bytes(4, "little")
+            + (int(x.st_mtime) & 0xFFFFFFFF).to_bytes(4, "little")
+            + (x.st_size & 0xFFFFFFFF).to_bytes(4, "little")
+        )
+    a = (os.path.abspath(fname), fname)
+    if (rv := _memo.get(a)) and rv[0] == k:
+        return rv[1]
+    h = importlib.util.MAGIC_NUMBER + h
+    if (rv := _read_cache(fname, h)) is None:
+        rv = compile(
+            importlib.util.decode_source(_read(fname) if s is None else s),
+            fname,
+            "exec",
+        )
+        _write_cache(fname, h, rv)
+    _memo[a] = (k, rv)
+    return rv
+
+
+def _init():
+    global _cfg
+
+    if _cfg:
+        return
+    from pykern import pkconfig
+
+    _cfg = pkconfig.init(
+        code_cache_check=(
+            "timestamp",
+            _cfg_code_cache_check,
+            "how to validate cached code: timestamp or checked_hash",
+        ),
+        code_cache_dir=(None, str, "directory for marshalled code objects"),
+    )
+
+
+def _read(fname):
+    with open(fname, "rb") as f:
+        return f.read()
+
+
+def _read_cache(fname, header):
+    if not _cfg.code_cache_dir:
+        return None
+    try:
+        d = _read(_cache_path(fname))
+        if d[: len(header)] == header:
+            return marshal.loads(memoryview(d)[len(header) :])
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    return None
+
+
+def _write_cache(fname, header, code):
+    if not _cfg.code_cache_dir:
+        return
+    p = _cache_path(fname)
+    t = f"{p}.{os.getpid()}"
+    try:
+        os.makedirs(_cfg.code_cache_dir, exist_ok=True)
+        with open(t, "wb") as f:
+            f.write(header + marshal.dumps(code))
+        os.replace(t, p)
+    except OSError:
+        # like importlib, a cache that can't be written is not an error
+        try:
+            os.remove(t)
+        except OSError:
+            pass
@@ -5,18 +5,26 @@
 """
 
 from pykern.pkcollections import PKDict
-from pykern.pkdebug import pkdc, pkdlog, pkdp, pkdformat
+from pykern.pkdebug import pkdc, pkdlog, pkdp, pkdformat, pkdexc
 import contextlib
 
 
 class API(PKDict):
-    """Holds request context for all API calls."""
+    """Holds request context for all API calls.
+
+    Attrs are created and started (`Attr.quest_start`) on first access
+    as an attribute or item so a quest only pays for the attrs it
+    uses. `Attr.quest_end` is only called on those attrs. An attr is
+    started in whichever thread first accesses it.
+    """
 
     METHOD_PREFIX = "api_"
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._destroyed = False
+        self._attrs_init_kwargs = None
+        self._attrs_pending = PKDict()
 
     def is_quest_end(self):
         return self._destroyed
@@ -38,26 +46,48 @@ class API(PKDict):
             _attr_end(k, v)
 
     def quest_init(self, attr_classes, init_kwargs):
-        def _set(name, attr):
-            if not isinstance(attr, Attr):
-                raise AssertionError(f"type=type(obj) not Attr name={name}")
-            if name in self:
-                raise AssertionError(f"name={name} already added")
-            self[name] = attr
+        """Register attrs to be created on first access
 
+        Args:
+            attr_classes (Iterable): `Attr` subclasses or instances
+            init_kwargs (PKDict): passed to `Attr.quest_init`
+        """
+        self._attrs_init_kwargs = init_kwargs
         for a in attr_classes:
-            s = a if isinstance(a, Attr) else a.quest_init(self, init_kwargs)
-            _set(s.ATTR_KEY, s)
+            n = a.ATTR_KEY
+            if n in self or n in self._attrs_pending:
+                raise AssertionError(f"name={n} already added")
+            self._attrs_pending[n] = a
 
     def quest_start(self):
-        for _, v in self.__attrs():
-            v.quest_start(self)
+        """Attrs are started on first access"""
+        pass
+
+    def __attr_start(self, name):
+        a = self._attrs_pending.pkdel(name)
+        s = a if isinstance(a, Attr) else a.quest_init(self, self._attrs_init_kwargs)
+        if not isinstance(s, Attr):
+            raise AssertionError(f"type={type(s)} not Attr name={name}")
+        s.quest_start(self)
+        # after quest_start so attrs it accessed end after this one
+        self[name] = s
+        return s
 
     def __attrs(self):
         for k, v in self.items():
-            if isinstance(k, Attr):
+            if isinstance(v, Attr):
                 yield k, v
 
+    def __getattr__(self, name):
+        if name not in self and name in self.get("_attrs_pending", ()):
+            return self.__attr_start(name)
+        return super().__getattr__(name)
+
+    def __missing__(self, key):
+        if key in self.get("_attrs_pending", ()):
+            return self.__attr_start(key)
+        raise KeyError(key)
+
 
 class Attr(PKDict):
     #: shared Attrs do not have link to qcall
@@ -119,7 +149,9 @@ class Attr(PKDict):
         return self
 
     def quest_start(self, qcall):
-        """Called after all attrs are initialized
+        """Called when first accessed on qcall, right after `quest_init`
+
+        Other attrs may be accessed, which starts them.
 
         Args:
             qcall (API): quest being started
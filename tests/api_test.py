@@ -7,6 +7,50 @@
 import pytest
 
 
+@pytest.mark.asyncio
+async def test_api_stats():
+    from pykern.api import unit_util
+    from pykern.pkcollections import PKDict
+
+    u = unit_util.Setup(
+        api_classes=(_class(),),
+        http_config=PKDict(stats_api=True, stats_uri="/api-stats"),
+    )
+    async with u as c:
+        from pykern import pkunit, pkjson
+        import tornado.httpclient
+
+        for _ in range(3):
+            await c.call_api("echo", PKDict())
+        with pkunit.pkexcept("unhandled_exception"):
+            await c.call_api("delay", PKDict())
+        with await c.subscribe_api("sub1", PKDict(iter_count=2)) as s:
+            while await s.result_get():
+                pass
+        r = await c.call_api("api_server_stats", PKDict())
+        e = r.apis.echo
+        pkunit.pkeq([3, 0, 0], [e.calls, e.errors, e.in_flight])
+        for k in "execution", "queue_wait", "serialization":
+            pkunit.pkeq(3, e[k].count)
+            pkunit.pkeq(3, sum(e[k].buckets))
+            pkunit.pkeq(len(r.bucket_secs) + 1, len(e[k].buckets))
+        pkunit.pkeq(1, r.apis.delay.errors)
+        # in_flight includes this call
+        pkunit.pkeq(1, r.apis.api_server_stats.in_flight)
+        s = r.apis.sub1
+        pkunit.pkeq([1, 0, 0], [s.calls, s.execution.count, s.queue_wait.count])
+        # two results and the end
+        pkunit.pkeq(3, s.serialization.count)
+        h = pkjson.load_any(
+            (
+                await tornado.httpclient.AsyncHTTPClient().fetch(
+                    f"http://{u.http_config.tcp_ip}:{u.http_config.tcp_port}/api-stats"
+                )
+            ).body
+        )
+        pkunit.pkeq(3, h.apis.echo.calls)
+
+
 @pytest.mark.asyncio
 async def test_basic():
     from pykern.api import unit_util
@@ -18,6 +62,401 @@ async def test_basic():
         e = PKDict(ping="pong")
         pkunit.pkeq(e.pkupdate(counter=1), await c.call_api("echo", e))
         pkunit.pkeq(e.pkupdate(counter=2), await c.call_api("echo", e))
+        r = await c.call_api("array", PKDict(n=2))
+        pkunit.pkeq([[0.0, 1.0], [2.0, 3.0]], r.ndarray.tolist())
+        pkunit.pkeq("float64", str(r.ndarray.dtype))
+        pkunit.pkeq([1.0, 2.0], r.pkarray.tolist())
+        pkunit.pkeq(b"\x00\x01", r.bytes)
+
+
+@pytest.mark.asyncio
+async def test_batch():
+    from pykern.api import unit_util
+
+    async with unit_util.Setup(api_classes=(_class(),)) as c:
+        from pykern.pkcollections import PKDict
+        from pykern import pkunit
+        import pykern.util, time
+
+        d = (0.4, 0.1, 0.2)
+        for s in (False, True):
+            t = time.monotonic()
+            pkunit.pkeq(
+                list(d),
+                await c.call_api_batch(
+                    [("delay", PKDict(delay=x)) for x in d],
+                    stream=s,
+                ),
+            )
+            # concurrent so less than the sum
+            pkunit.pkok(
+                time.monotonic() - t < sum(d),
+                "stream={} batch not concurrent",
+                s,
+            )
+            r = await c.call_api_batch(
+                (("echo", PKDict(a=1)), ("not_found", PKDict())),
+                stream=s,
+                return_exceptions=True,
+            )
+            pkunit.pkeq(1, r[0].a)
+            pkunit.pkeq(pykern.util.APIError, type(r[1]))
+        with pkunit.pkexcept("not_found"):
+            await c.call_api_batch((("not_found", PKDict()),))
+        with pkunit.pkexcept("must be"):
+            await c.call_api_batch((("echo", PKDict()), "echo"))
+        pkunit.pkeq(0, len(c._pending_calls))
+        # connection is still usable
+        pkunit.pkeq(2, (await c.call_api("echo", PKDict(a=2))).a)
+
+
+@pytest.mark.asyncio
+async def test_blocking():
+    from pykern.api import unit_util
+
+    u = unit_util.Setup(api_classes=(_class(),))
+    async with u as c:
+        from pykern.pkcollections import PKDict
+        from pykern import pkunit
+        import asyncio, time
+
+        t = time.monotonic()
+        b = asyncio.create_task(c.call_api("blocking_sleep", PKDict(secs=0.5)))
+        await asyncio.sleep(0.1)
+        # event loop is not blocked
+        pkunit.pkeq(1, (await c.call_api("echo", PKDict())).counter)
+        pkunit.pkok(time.monotonic() - t < 0.4, "echo blocked by blocking_sleep")
+        # quest attrs available in thread
+        pkunit.pkeq(1, await b)
+        r = await c.call_api("cpu", PKDict(n=1000))
+        pkunit.pkeq(sum(range(1000)), r.sum)
+        pkunit.pkne(u.server_pid, r.pid)
+        t = time.monotonic()
+        r = await asyncio.gather(
+            *(c.call_api("serial", PKDict(secs=0.2)) for _ in range(2))
+        )
+        pkunit.pkeq(r[0], r[1])
+        pkunit.pkok(time.monotonic() - t >= 0.4, "action_loop calls not serial")
+        w = (await c.call_api("cpu", PKDict(n=1))).pid
+    import psutil, time
+
+    # spawned pool workers exit with the server
+    for _ in range(50):
+        try:
+            if psutil.Process(w).status() == psutil.STATUS_ZOMBIE:
+                break
+        except psutil.NoSuchProcess:
+            break
+        time.sleep(0.1)
+    else:
+        raise AssertionError(f"process pool worker pid={w} still running")
+
+
+@pytest.mark.asyncio
+async def test_blocking_disconnect():
+    from pykern.api import unit_util
+    from pykern import pkunit
+    import asyncio
+
+    p = pkunit.empty_work_dir().join("is_quest_end")
+    async with unit_util.Setup(api_classes=(_class(),)) as c:
+        from pykern.pkcollections import PKDict
+
+        t = asyncio.create_task(
+            c.call_api("blocking_quest_end", PKDict(path=str(p), secs=0.5))
+        )
+        await asyncio.sleep(0.1)
+        c.destroy()
+        await asyncio.gather(t, return_exceptions=True)
+        for _ in range(20):
+            if p.exists():
+                break
+            await asyncio.sleep(0.1)
+        # quest did not end while func was running in the thread
+        pkunit.pkeq("False", p.read())
+
+
+@pytest.mark.asyncio
+async def test_cache():
+    from pykern.api import unit_util
+    from pykern import pkunit
+    from pykern.pkcollections import PKDict
+    import asyncio
+
+    async with unit_util.Setup(
+        api_classes=(_class(),), http_config=PKDict(stats_api=True)
+    ) as c:
+
+        async def _calls(api_name, **kwargs):
+            return (await c.call_api(api_name, PKDict(kwargs))).calls
+
+        pkunit.pkeq(1, await _calls("cached", a=1, b=2))
+        # key order does not matter
+        pkunit.pkeq(1, await _calls("cached", b=2, a=1))
+        pkunit.pkeq(2, await _calls("cached", a=2))
+        pkunit.pkeq(3, await _calls("cached", a=3))
+        # max_size=2 discarded least recently used
+        pkunit.pkeq(4, await _calls("cached", a=1, b=2))
+        pkunit.pkeq(3, await _calls("cached", a=3))
+        pkunit.pkeq(
+            1,
+            await c.call_api("cache_invalidate", PKDict(api_args=PKDict(a=3))),
+        )
+        pkunit.pkeq(5, await _calls("cached", a=3))
+        pkunit.pkeq(2, await c.call_api("cache_invalidate", PKDict()))
+        pkunit.pkeq(6, await _calls("cached", a=3))
+        pkunit.pkeq(1, await _calls("cached_packed", a=1))
+        pkunit.pkeq(1, await _calls("cached_packed", a=1))
+        r = await c.call_api_batch([("cached_packed", PKDict(a=1))] * 2)
+        pkunit.pkeq([1, 1], [x.calls for x in r])
+        await asyncio.sleep(0.5)
+        # expired
+        pkunit.pkeq(2, await _calls("cached_packed", a=1))
+        r = await c.call_api("api_server_stats", PKDict())
+        pkunit.pkeq(PKDict(hits=2, misses=6, size=1), r.apis.cached.cache)
+        pkunit.pkeq(PKDict(hits=3, misses=2, size=1), r.apis.cached_packed.cache)
+
+
+@pytest.mark.asyncio
+async def test_call_limits():
+    from pykern.api import unit_util
+    from pykern.pkcollections import PKDict
+
+    async with unit_util.Setup(
+        api_classes=(_class(),),
+        http_config=PKDict(max_connection_calls=2, max_connection_queue=3),
+    ) as c:
+        from pykern import pkunit
+        import pykern.util, time
+
+        t = time.monotonic()
+        await c.call_api_batch([("delay", PKDict(delay=0.2))] * 5)
+        # three rounds of two
+        pkunit.pkok(time.monotonic() - t >= 0.55, "calls not limited")
+        r = await c.call_api("call_stats", PKDict())
+        pkunit.pkeq(1, r.server.in_flight)
+        # server has no limit
+        pkunit.pkeq(0, r.server.queued_total)
+        pkunit.pkeq(1, len(r.connections))
+        s = list(r.connections.values())[0]
+        pkunit.pkeq(3, s.max_queued)
+        pkunit.pkeq(3, s.queued_total)
+        pkunit.pkeq(0, s.rejected)
+        pkunit.pkok(s.max_wait_secs >= 0.35, "max_wait_secs={}", s.max_wait_secs)
+        with pkunit.pkexcept(pykern.util.APIError):
+            await c.call_api_batch([("delay", PKDict(delay=0.2))] * 6)
+
+
+@pytest.mark.asyncio
+async def test_cancel():
+    from pykern.api import unit_util
+    from pykern import pkunit
+    from pykern.pkcollections import PKDict
+    import asyncio
+
+    async def _wait(path):
+        for _ in range(20):
+            if path.exists() and "in_error" in path.read():
+                return path.read()
+            await asyncio.sleep(0.1)
+        raise AssertionError(f"quest did not end path={path}")
+
+    d = pkunit.empty_work_dir()
+    async with unit_util.Setup(api_classes=(_class(),)) as c:
+        p = d.join("unsubscribe")
+        s = await c.subscribe_api("sub_cancel", PKDict(path=str(p)))
+        await asyncio.sleep(0.2)
+        s.unsubscribe()
+        pkunit.pkeq("cancelled in_error=True", await _wait(p))
+        p = d.join("disconnect")
+        t = asyncio.create_task(c.call_api("cancel", PKDict(path=str(p))))
+        await asyncio.sleep(0.2)
+        c.destroy()
+        await asyncio.gather(t, return_exceptions=True)
+        pkunit.pkeq("cancelled in_error=True", await _wait(p))
+
+
+@pytest.mark.asyncio
+async def test_compression_bench():
+    from pykern.pkcollections import PKDict
+    import os
+
+    p = PKDict(
+        compressible=b"pykern api compression " * 10000,
+        incompressible=os.urandom(230000),
+    )
+    for l in (None, 6):
+        async with _compression_setup(l) as c:
+            from pykern import pkunit, pkdebug
+            import time
+
+            pkunit.pkeq(
+                l is not None,
+                "permessage-deflate"
+                in c._connection.headers.get("Sec-WebSocket-Extensions", ""),
+            )
+            # below compression_min_size
+            pkunit.pkeq(b"x", (await c.call_api("echo", PKDict(data=b"x"))).data)
+            for k, v in p.items():
+                n = 20
+                t = time.perf_counter()
+                u = time.process_time()
+                for _ in range(n):
+                    r = await c.call_api("echo", PKDict(data=v))
+                t = time.perf_counter() - t
+                u = time.process_time() - u
+                pkunit.pkeq(v, r.data)
+                # bytes sent and received
+                b = 2 * n * len(v)
+                pkdebug.pkdlog(
+                    "compression_level={} {} MB/s={:.1f} client_cpu_ns/byte={:.2f}",
+                    l,
+                    k,
+                    b / t / 1e6,
+                    u / b * 1e9,
+                )
+
+
+@pytest.mark.asyncio
+async def test_load():
+    from pykern.api import unit_util
+    from pykern.pkcollections import PKDict
+    from pykern import pkunit
+    from pykern.pkdebug import pkdlog
+    import copy
+
+    w = (
+        PKDict(api_name="echo", api_args=PKDict(), weight=3),
+        PKDict(api_name="sub1", api_args=PKDict(iter_count=1), subscribe=True),
+        PKDict(api_name="delay", api_args=PKDict(), name="error"),
+    )
+    b = pkunit.empty_work_dir().join("baseline.json")
+    for p in None, 2:
+        async with unit_util.LoadTest(
+            w, clients=3, ops=20, processes=p, api_classes=(_class(),)
+        ) as t:
+            r = await t.run()
+        pkdlog("processes={} report={}", p, r)
+        pkunit.pkeq(3 * (p or 1), r.clients)
+        pkunit.pkeq(r.clients * 20, r.ops + r.errors)
+        pkunit.pkeq(0, r.latency.error.count)
+        pkunit.pkeq(r.ops, r.latency.echo.count + r.latency.sub1.count)
+        pkunit.pkok(
+            r.latency.all.p50 <= r.latency.all.p99 <= r.latency.all.max,
+            "percentiles not ordered={}",
+            r.latency.all,
+        )
+        if p is None:
+            # first writes baseline
+            pkunit.pkeq([], t.baseline_compare(r, b))
+            pkunit.pkok(b.exists(), "baseline not written")
+            x = copy.deepcopy(r)
+    pkunit.pkeq([], t.baseline_compare(x, b))
+    x.ops_per_sec /= 2
+    x.latency.echo.p99 *= 2
+    pkunit.pkeq(2, len(t.baseline_compare(x, b)))
+
+
+@pytest.mark.asyncio
+async def test_pool():
+    from pykern.api import unit_util
+
+    u = unit_util.Setup(api_classes=(_class(),))
+    async with u:
+        from pykern.api import client, pool, util
+        from pykern.pkcollections import PKDict
+        from pykern import pkunit
+        import asyncio, pykern.util
+
+        async with pool.Pool(
+            (u.http_config,),
+            connections=3,
+            auth_args=PKDict(token=unit_util._AUTH_TOKEN),
+            reconnect_secs=0.1,
+        ) as p:
+            # each connection has its own session so counters are separate
+            r = await asyncio.gather(*(p.call_api("echo", PKDict()) for _ in range(3)))
+            pkunit.pkeq([1, 1, 1], [x.counter for x in r])
+            # least outstanding skips busy connection
+            d = asyncio.create_task(p.call_api("delay", PKDict(delay=0.5)))
+            await asyncio.sleep(0.1)
+            r = [(await p.call_api("echo", PKDict())).counter for _ in range(4)]
+            pkunit.pkeq([2, 2, 3, 3], sorted(r))
+            await d
+            # lost connection is reconnected by the client
+            p._slots[0].client._connection.close()
+            await asyncio.sleep(0.05)
+            pkunit.pkeq(False, p.stats()[0].connected)
+            for _ in range(3):
+                await p.call_api("echo", PKDict())
+            for _ in range(20):
+                if (s := p.stats())[0].connected:
+                    break
+                await asyncio.sleep(0.1)
+            pkunit.pkeq(1, s[0].disconnects)
+            pkunit.pkeq(client.uri(u.http_config), s[0].uri)
+            pkunit.pkok(all(x.connected for x in s), "not all connected={}", s)
+            pkunit.pkeq(0, sum(x.outstanding for x in s))
+        # unreachable server reconnects in the background
+        async with pool.Pool(
+            (
+                u.http_config,
+                u.http_config.copy().pkupdate(
+                    tcp_port=pykern.util.unbound_localhost_tcp_port()
+                ),
+            ),
+            auth_args=PKDict(token=unit_util._AUTH_TOKEN),
+            reconnect_secs=0.1,
+        ) as p:
+            pkunit.pkeq(1, (await p.call_api("echo", PKDict())).counter)
+            await asyncio.sleep(0.3)
+            s = p.stats()
+            pkunit.pkeq([True, False], [x.connected for x in s])
+            pkunit.pkok(s[1].reconnect_failures > 0, "no reconnect attempts={}", s)
+
+
+@pytest.mark.asyncio
+async def test_reconnect():
+    from pykern.api import unit_util
+
+    u = unit_util.Setup(api_classes=(_class(),))
+    async with u:
+        from pykern.api import client, util
+        from pykern.pkcollections import PKDict
+        from pykern import pkunit
+        import asyncio, os, signal
+
+        c = client.Client(
+            u.http_config.copy().pkupdate(reconnect_secs=0.1, reconnect_max_secs=0.5)
+        )
+        try:
+            await c.connect(PKDict(token=unit_util._AUTH_TOKEN))
+            s = await c.subscribe_api("sub1", PKDict(iter_count=100))
+            pkunit.pkeq(PKDict(count=0), await s.result_get())
+            i = asyncio.create_task(
+                c.call_api("delay", PKDict(delay=0.5), idempotent=True)
+            )
+            n = asyncio.create_task(c.call_api("delay", PKDict(delay=0.5)))
+            await asyncio.sleep(0.1)
+            os.kill(u.server_pid, signal.SIGKILL)
+            os.waitpid(u.server_pid, 0)
+            with pkunit.pkexcept(util.APIDisconnected):
+                await n
+            u.server_pid = u._server_process()
+            # waits for reconnect
+            pkunit.pkeq(1, (await c.call_api("echo", PKDict())).counter)
+            pkunit.pkeq(0.5, await i)
+            # subscription started over
+            while (r := await s.result_get()).count != 0:
+                pass
+            s.unsubscribe()
+            r = c.stats()
+            pkunit.pkeq(1, r.disconnects)
+            pkunit.pkeq(1, r.resubscribes)
+            pkunit.pkeq(1, r.retries)
+            pkunit.pkok(r.connects >= 2, "connects={}", r.connects)
+        finally:
+            c.destroy()
 
 
 @pytest.mark.asyncio
@@ -56,14 +495,387 @@ async def test_subscribe():
                 await o(n, s)
 
 
+@pytest.mark.asyncio
+async def test_publish():
+    from pykern.api import unit_util
+
+    async with unit_util.Setup(api_classes=(_class(),)) as c:
+        from pykern.pkcollections import PKDict
+        from pykern import pkunit
+        from pykern.api import util
+        import asyncio
+
+        r, e = util.msg_unpack(
+            util.msg_pack_reply_call_id(util.msg_pack_reply(PKDict(a=[1, 2])), 99),
+            "client",
+        )
+        pkunit.pkeq(None, e)
+        pkunit.pkeq(PKDict(a=[1, 2]), r.api_result)
+        pkunit.pkeq(99, r.call_id)
+        pkunit.pkeq(util.MsgKind.REPLY, r.msg_kind)
+        s = [await c.subscribe_api("topic", PKDict(topic="t")) for _ in range(2)]
+        for x in s:
+            # listening after ready
+            pkunit.pkeq(PKDict(ready=True), await x.result_get())
+
+        async def _publish(expect):
+            for _ in range(20):
+                if (
+                    n := await c.call_api(
+                        "publish", PKDict(topic="t", result=PKDict(x=expect))
+                    )
+                ) == expect:
+                    return
+                await asyncio.sleep(0.1)
+            pkunit.pkfail("expect={} subscribers={}", expect, n)
+
+        await _publish(2)
+        for x in s:
+            pkunit.pkeq(PKDict(x=2), await x.result_get())
+        s.pop().unsubscribe()
+        await _publish(1)
+        pkunit.pkeq(PKDict(x=1), await s[0].result_get())
+        s[0].unsubscribe()
+        await _publish(0)
+
+
+@pytest.mark.asyncio
+async def test_subscribe_credits():
+    from pykern.api import unit_util
+
+    async def _results(sub):
+        rv = []
+        while (r := await sub.result_get()) is not None:
+            rv.append(r.count)
+            await asyncio.sleep(0.05)
+        return rv
+
+    async with unit_util.Setup(api_classes=(_class(),)) as c:
+        from pykern.pkcollections import PKDict
+        from pykern import pkunit
+        import asyncio
+
+        with await c.subscribe_api("sub_latest", PKDict(iter_count=20), credits=1) as s:
+            await asyncio.sleep(0.5)
+            r = await _results(s)
+            pkunit.pkeq(0, r[0])
+            pkunit.pkeq(19, r[-1])
+            pkunit.pkok(len(r) < 20, "results not coalesced={}", r)
+        with await c.subscribe_api("sub_wait", PKDict(iter_count=10), credits=2) as s:
+            pkunit.pkeq(list(range(10)), await _results(s))
+        with await c.subscribe_api("sub_put", PKDict(iter_count=10), credits=2) as s:
+            # sent two and queued two
+            with pkunit.pkexcept("use result_send"):
+                await _results(s)
+
+
+@pytest.mark.asyncio
+async def test_timeout():
+    from pykern.api import unit_util
+    from pykern import pkunit
+    from pykern.pkcollections import PKDict
+
+    d = pkunit.empty_work_dir()
+    u = unit_util.Setup(
+        api_classes=(_class(),),
+        http_config=PKDict(stats_api=True),
+    )
+    async with u as c:
+        import time
+
+        pkunit.pkeq(None, (await c.call_api("deadline", PKDict())).remaining_secs)
+        r = (await c.call_api("deadline", PKDict(), timeout=5)).remaining_secs
+        pkunit.pkok(0 < r <= 5, "remaining_secs={}", r)
+        pkunit.pkeq(0.1, await c.call_api("delay", PKDict(delay=0.1), timeout=5))
+        t = time.monotonic()
+        with pkunit.pkexcept("APITimeout"):
+            await c.call_api("delay", PKDict(delay=5), timeout=0.2)
+        pkunit.pkok(time.monotonic() - t < 2, "call not cancelled at deadline")
+        with pkunit.pkexcept("APITimeout"):
+            await c.call_api_batch([("delay", PKDict(delay=5))], timeout=0.2)
+        s = await c.subscribe_api("sub1", PKDict(iter_count=100), timeout=0.5)
+        with pkunit.pkexcept("APITimeout"):
+            while await s.result_get():
+                pass
+        p = d.join("blocking")
+        with pkunit.pkexcept("APITimeout"):
+            await c.call_api(
+                "blocking_quest_end", PKDict(path=str(p), secs=0.5), timeout=0.1
+            )
+        # not cancelled so quest ends after func returns
+        pkunit.pkeq("False", p.read())
+        with pkunit.pkexcept("timeout=0 must be"):
+            await c.call_api("delay", PKDict(delay=0), timeout=0)
+        r = await c.call_api("api_server_stats", PKDict())
+        pkunit.pkeq(2, r.apis.delay.timeouts)
+        pkunit.pkeq(1, r.apis.sub1.timeouts)
+
+
+@pytest.mark.asyncio
+async def test_ws_write():
+    async with _compression_setup(6) as c:
+        from pykern.api import util
+        from pykern.pkcollections import PKDict
+        from pykern import pkunit
+        import tornado.websocket
+
+        p = c._connection.protocol
+        # ws_write depends on these tornado internals
+        pkunit.pkok(p._compressor, "_compressor not set by tornado")
+        f = []
+        w = p._write_frame
+
+        def _write_frame(fin, opcode, data, flags=0):
+            f.append(flags)
+            return w(fin, opcode, data, flags)
+
+        p._write_frame = _write_frame
+        m = util.msg_pack(PKDict(call_id=1, msg_kind=util.MsgKind.UNSUBSCRIBE))
+        util.ws_write(p, m, 1024)
+        util.ws_write(p, m, len(m))
+        pkunit.pkeq([0, p.RSV1], [x & p.RSV1 for x in f])
+        pkunit.pkok(p._compressor, "_compressor not restored")
+        c._connection.close()
+        with pkunit.pkexcept(tornado.websocket.WebSocketClosedError):
+            util.ws_write(p, m, 1024)
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_bench():
+    from pykern.api import unit_util
+    from pykern.pkcollections import PKDict
+    from pykern import pkunit
+    from pykern.pkdebug import pkdlog
+
+    class _Setup(unit_util.LoadTest):
+        def _http_config(self):
+            rv = super()._http_config()
+            if self._unix_socket:
+                rv.unix_socket = self._unix_socket
+            return rv
+
+    d = pkunit.empty_work_dir()
+    r = PKDict()
+    for k, u in ("tcp", None), ("unix", str(d.join("api.sock"))):
+        _Setup._unix_socket = u
+        async with _Setup(
+            (PKDict(api_name="echo", api_args=PKDict(data=b"x" * 1000)),),
+            clients=4,
+            ops=200,
+            api_classes=(_class(),),
+        ) as t:
+            r[k] = await t.run()
+        pkunit.pkeq(0, r[k].errors)
+        pkunit.pkeq(800, r[k].ops)
+    pkunit.pkok(d.join("api.sock").exists(), "unix socket not created")
+    for k, v in r.items():
+        pkdlog(
+            "transport={} ops/s={:.0f} p50_ms={:.3f} p99_ms={:.3f}",
+            k,
+            v.ops_per_sec,
+            v.latency.all.p50 * 1000,
+            v.latency.all.p99 * 1000,
+        )
+
+
+def test_msg_pack_array():
+    from pykern.api import util
+    from pykern.pkcollections import PKDict
+    from pykern import pkunit, pkarray
+    import numpy
+
+    def _round_trip(value, has_numpy=True):
+        b = util.msg_pack(PKDict(call_id=1, msg_kind=util.MsgKind.REPLY, v=value))
+        try:
+            if not has_numpy:
+                util.numpy = None
+            r, e = util.msg_unpack(b, "client")
+        finally:
+            util.numpy = numpy
+        pkunit.pkeq(None, e)
+        return r.v
+
+    a = numpy.arange(24, dtype=">i4").reshape(2, 3, 4)
+    for v in (
+        a,
+        a.T,
+        numpy.array(1.5),
+        numpy.array([1 + 2j, 3j]),
+        numpy.zeros((0, 3)),
+    ):
+        r = _round_trip(v)
+        pkunit.pkeq(v.dtype, r.dtype)
+        pkunit.pkeq(v.tolist(), r.tolist())
+    pkunit.pkeq(["a"], _round_trip(numpy.array(["a"])))
+    pkunit.pkeq(
+        [1.0, None, 3.0],
+        _round_trip(numpy.ma.masked_array([1.0, 2.0, 3.0], mask=[0, 1, 0])),
+    )
+    pkunit.pkeq(False, _round_trip(a).flags.writeable)
+    pkunit.pkeq([1.0, 2.0], _round_trip(pkarray.new_double([1, 2])).tolist())
+    for v in (a.T, numpy.array([1 + 2j]), numpy.array(True)):
+        pkunit.pkeq(v.tolist(), _round_trip(v, has_numpy=False))
+    pkunit.pkeq([1.0, 2.0], _round_trip(pkarray.new_float([1, 2]), has_numpy=False))
+
+
+def test_msg_pack_bench():
+    from pykern.api import util
+    from pykern.pkcollections import PKDict
+    from pykern import pkunit
+    from pykern.pkdebug import pkdlog
+    import time
+
+    def _rate(msg, packer):
+        n = 0
+        s = time.perf_counter()
+        while (t := time.perf_counter() - s) < 0.2:
+            util.msg_pack(msg, packer)
+            n += 1
+        return int(n / t)
+
+    p = util.msg_packer()
+    for n in (1, 100, 10000):
+        m = PKDict(
+            api_result=PKDict(values=list(range(n)), name="x" * n),
+            api_error=None,
+            call_id=n,
+            msg_kind=util.MsgKind.REPLY,
+        )
+        r, e = util.msg_unpack(util.msg_pack(m, p), "client")
+        pkunit.pkeq(None, e)
+        pkunit.pkeq(m.api_result, r.api_result)
+        pkdlog(
+            "payload_items={} msgs/sec new_packer={} reused_packer={}",
+            n,
+            _rate(m, None),
+            _rate(m, p),
+        )
+
+
+def test_msg_unpack_bench():
+    from pykern.api import util
+    from pykern.pkcollections import PKDict
+    from pykern import pkunit, pkcollections
+    from pykern.pkdebug import pkdlog
+    import msgpack, time
+
+    def _rate(op):
+        n = 0
+        s = time.perf_counter()
+        while (t := time.perf_counter() - s) < 0.2:
+            op()
+            n += 1
+        return int(n / t)
+
+    def _streaming(msg):
+        # what msg_unpack used to do
+        u = msgpack.Unpacker(object_hook=pkcollections.object_pairs_hook)
+        u.feed(msg)
+        return u.unpack()
+
+    for n in (1, 100, 10000):
+        m = util.msg_pack(
+            PKDict(
+                api_name="echo",
+                api_args=PKDict({f"k{i}": PKDict(v=i) for i in range(n)}),
+                call_id=n,
+                msg_kind=util.MsgKind.CALL,
+            ),
+        )
+        r, e = util.msg_unpack(m, "server")
+        pkunit.pkeq(None, e)
+        pkunit.pkeq(n, len(r.api_args))
+        pkunit.pkeq(util.MsgKind.CALL, r.msg_kind)
+        pkdlog(
+            "api_args_items={} msgs/sec streaming={} msg_unpack={}",
+            n,
+            _rate(lambda: _streaming(m)),
+            _rate(lambda: util.msg_unpack(m, "server")),
+        )
+
+
 def _class():
     from pykern.api import util
     from pykern.pkcollections import PKDict
     from pykern import quest
-    import asyncio
+    import asyncio, threading, time
+
+    calls = PKDict(cached=0, cached_packed=0)
 
     class _API(quest.API):
 
+        def quest_end(self, in_error=True):
+            if p := self.get("cancel_path"):
+                with open(p, "a") as f:
+                    f.write(f" in_error={in_error}")
+            super().quest_end(in_error=in_error)
+
+        @util.blocking
+        def api_blocking_sleep(self, api_args):
+            time.sleep(api_args.secs)
+            return self.session.counter
+
+        @util.blocking
+        def api_blocking_quest_end(self, api_args):
+            time.sleep(api_args.secs)
+            with open(api_args.path, "w") as f:
+                f.write(str(self.is_quest_end()))
+
+        # process pools pickle functions by reference
+        api_cpu = staticmethod(util.blocking(executor="process")(_cpu))
+
+        async def api_array(self, api_args):
+            import numpy
+            from pykern import pkarray
+
+            return PKDict(
+                bytes=bytes(range(api_args.n)),
+                ndarray=numpy.arange(api_args.n**2, dtype=float).reshape(
+                    api_args.n, api_args.n
+                ),
+                pkarray=pkarray.new_double(range(1, api_args.n + 1)),
+            )
+
+        async def api_cancel(self, api_args):
+            self.cancel_path = api_args.path
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                with open(api_args.path, "w") as f:
+                    f.write("cancelled")
+                raise
+
+        @util.subscription
+        async def api_sub_cancel(self, api_args):
+            return await self.api_cancel(api_args)
+
+        async def api_cache_invalidate(self, api_args):
+            from pykern.api import server
+
+            return server.cache_invalidate("cached", api_args.get("api_args"))
+
+        @util.cache(max_size=2)
+        async def api_cached(self, api_args):
+            calls.cached += 1
+            return PKDict(calls=calls.cached)
+
+        @util.cache(packed=True, ttl_secs=0.3)
+        async def api_cached_packed(self, api_args):
+            calls.cached_packed += 1
+            return PKDict(calls=calls.cached_packed)
+
+        async def api_call_stats(self, api_args):
+            from pykern.api import server
+
+            return server.call_stats()
+
+        async def api_deadline(self, api_args):
+            return PKDict(remaining_secs=self.deadline.remaining_secs())
+
+        async def api_delay(self, api_args):
+            await asyncio.sleep(api_args.delay)
+            return api_args.delay
+
         async def api_echo(self, api_args):
             self.session.pksetdefault(counter=0).counter += 1
             return api_args.pkupdate(counter=self.session.counter)
@@ -78,4 +890,63 @@ def _class():
                 self.subscription.result_put(PKDict(count=i))
             return None
 
+        async def api_publish(self, api_args):
+            from pykern.api import server
+
+            return server.publish(api_args.topic, api_args.result)
+
+        @util.subscription
+        async def api_topic(self, api_args):
+            self.subscription.result_put(PKDict(ready=True))
+            await self.subscription.topic_listen(api_args.topic)
+            return None
+
+        @util.blocking(executor="action_loop")
+        def api_serial(self, api_args):
+            time.sleep(api_args.secs)
+            return threading.get_ident()
+
+        @util.subscription(overflow="latest")
+        async def api_sub_latest(self, api_args):
+            for i in range(api_args.iter_count):
+                await asyncio.sleep(0.01)
+                self.subscription.result_put(PKDict(count=i))
+            return None
+
+        @util.subscription
+        async def api_sub_put(self, api_args):
+            for i in range(api_args.iter_count):
+                self.subscription.result_put(PKDict(count=i))
+            return None
+
+        @util.subscription
+        async def api_sub_wait(self, api_args):
+            for i in range(api_args.iter_count):
+                await self.subscription.result_send(PKDict(count=i))
+            return None
+
     return _API
+
+
+def _compression_setup(compression_level, **kwargs):
+    from pykern.api import unit_util
+
+    class _Setup(unit_util.Setup):
+        def _http_config(self):
+            return (
+                super()
+                ._http_config()
+                .pkupdate(
+                    compression_level=compression_level,
+                    compression_min_size=1024,
+                )
+            )
+
+    return _Setup(api_classes=(_class(),), **kwargs)
+
+
+def _cpu(api_args):
+    from pykern.pkcollections import PKDict
+    import os
+
+    return PKDict(pid=os.getpid(), sum=sum(range(api_args.n)))
@@ -35,3 +35,104 @@ def test_parse_all():
     pkunit.pkok("not-seen" not in a, "not-seen got parsed values={}", a)
     pkunit.pkeq(2.7, a.pi)
     pkunit.pkeq(1.6, a.e)
+
+
+def test_parse_all_cache():
+    from pykern import pkunit, fconf, pkio
+    from pykern.pkcli import fconf as fconf_cli
+    from pykern.pkcollections import PKDict
+
+    d = pkunit.work_dir().join("cache_in").ensure(dir=1)
+    d.join("1.yml").write("---\npi: 3.14\ne: double(${v.e})\n")
+    d.join("0.py").write("def double(self, x):\n    return 2 * x\n")
+    pkunit.pkre("disabled", fconf_cli.cache_info())
+    fconf._cfg.cache_dir = pkunit.work_dir().join("cache")
+    try:
+        b = PKDict(v=PKDict(e=2.7))
+        a = fconf.parse_all(d, base_vars=b)
+        pkunit.pkeq(5.4, a.e)
+        pkunit.pkeq(PKDict(hits=0, misses=1, stores=1), _stats(fconf))
+        pkunit.pkeq(a, fconf.parse_all(d, base_vars=b))
+        pkunit.pkeq(1, _stats(fconf).hits)
+        pkunit.pkeq(1.0, fconf.parse_all(d, base_vars=PKDict(v=PKDict(e=0.5))).e)
+        d.join("1.yml").write("---\npi: 3\ne: double(${v.e})\n")
+        pkunit.pkeq(3, fconf.parse_all(d, base_vars=b).pi)
+        pkunit.pkeq(PKDict(hits=1, misses=3, stores=3), _stats(fconf))
+        pkunit.pkre('"entries": 3', fconf_cli.cache_info())
+        pkunit.pkeq("removed entries=3", fconf_cli.cache_clear())
+        pkunit.pkeq(0, fconf.cache_info().entries)
+    finally:
+        fconf._cfg.cache_dir = None
+
+
+def _stats(fconf):
+    from pykern.pkcollections import PKDict
+
+    i = fconf.cache_info()
+    return PKDict((k, i[k]) for k in ("hits", "misses", "stores"))
+
+
+def test_expr_cache():
+    from pykern import pkunit, fconf, pkio
+
+    with pkunit.save_chdir_work():
+        pkio.write_text(
+            "1.yml",
+            """---
+fconf_macros:
+  host(n):
+    v${n}.radia.run:
+      n: ${n}
+  uri(h): "https://${h}"
+n: 3
+raw: $${n}
+all:
+  host(1):
+  host(${n}):
+  host(4):
+uris:
+  - uri('a')
+  - uri('a')
+  - uri('${raw}')
+""",
+        )
+        r = fconf.Parser([pkio.py_path("1.yml")]).result
+        pkunit.pkeq(
+            ["v1.radia.run", "v3.radia.run", "v4.radia.run"],
+            sorted(r.all.keys()),
+        )
+        pkunit.pkeq(3, r.all["v3.radia.run"].n)
+        pkunit.pkeq(["https://a", "https://a", "https://$3"], r.uris)
+
+
+def test_refresh():
+    from pykern import pkunit, fconf, pkio
+    import os
+
+    def _touch(path, text):
+        pkio.write_text(path, text)
+        s = os.stat(path)
+        # ensure stamp changes even on coarse mtime filesystems
+        os.utime(path, ns=(s.st_atime_ns, s.st_mtime_ns + 10**9))
+
+    with pkunit.save_chdir_work():
+        _touch("1.yml", "---\na: 1\n")
+        _touch("2.yml", "---\nb: ${a}\nc: double(${a})\n")
+        _touch("3.yml", "---\nd: ${b}\n")
+        _touch("0.py", "def double(self, x):\n    return 2 * x\n")
+        f = [pkio.py_path(x) for x in ("0.py", "1.yml", "2.yml", "3.yml")]
+        p = fconf.Parser(f, incremental=True)
+        pkunit.pkeq(dict(a=1, b=1, c=2, d=1), p.result)
+        pkunit.pkeq(False, p.refresh())
+        y1 = p.files.yml[0]
+        _touch("2.yml", "---\nb: 5\nc: double(${b})\n")
+        pkunit.pkeq(True, p.refresh())
+        pkunit.pkeq(dict(a=1, b=5, c=10, d=5), p.result)
+        pkunit.pkok(y1 is p.files.yml[0], "1.yml should not have been re-parsed")
+        _touch("0.py", "def double(self, x):\n    return 3 * x\n")
+        pkunit.pkeq(True, p.refresh())
+        pkunit.pkeq(dict(a=1, b=5, c=15, d=5), p.result)
+        _touch("1.yml", "---\na: 2\nfconf_macros:\n  m(x): ${x}\n")
+        p.refresh()
+        pkunit.pkeq(dict(a=2, b=5, c=15, d=5), p.result)
+        pkunit.pkok("m" in p.macros, "macro m not registered")
@@ -29,3 +29,70 @@ def test_render_resource():
         assert expect == pkio.read_text(
             out
         ), "With out, render_resource should write file"
+
+
+def test_cache():
+    import time
+    from pykern import pkio, pkjinja, pkunit
+    from pykern.pkdebug import pkdlog
+
+    def _bench(count, clear):
+        s = time.perf_counter()
+        for _ in range(count):
+            if clear:
+                pkjinja.clear_cache()
+            pkjinja.render_file(t, v)
+        return (time.perf_counter() - s) / count
+
+    pkjinja.clear_cache()
+    v = {"k1": "v1"}
+    with pkunit.save_chdir_work() as d:
+        t = d.join("t.jinja")
+        pkio.write_text(t, "{% for x in range(2) %}\n!{{ k1 }}!\n{% endfor %}\n")
+        pkunit.pkeq("!v1!\n!v1!\n", pkjinja.render_file(t, v))
+        pkunit.pkeq("!v1!\n!v1!\n", pkjinja.render_file(t, v))
+        pkunit.pkeq(
+            {
+                "env_hits": 1,
+                "env_misses": 1,
+                "template_hits": 1,
+                "template_misses": 1,
+                "templates": 1,
+            },
+            pkjinja.cache_stats(),
+        )
+        pkjinja.render_file(t, v, strict_undefined=True)
+        pkunit.pkeq(2, pkjinja.cache_stats().env_misses)
+        pkio.write_text(t, "{{ k1 }}")
+        pkunit.pkeq("v1", pkjinja.render_file(t, v))
+        pkunit.pkeq(3, pkjinja.cache_stats().template_misses)
+        pkunit.pkeq(
+            "x",
+            pkjinja.render_file(t, v, jinja_env=dict(finalize=lambda x: "x")),
+        )
+        # functions are not cached
+        pkunit.pkeq(2, pkjinja.cache_stats().env_misses)
+        pkunit.pkeq(2, len(pkjinja._envs))
+        n = 200
+        pkdlog(
+            "render_file secs/call uncached={} cached={}",
+            _bench(n, True),
+            _bench(n, False),
+        )
+
+
+def test_stream():
+    from pykern import pkio, pkjinja, pkunit
+
+    with pkunit.save_chdir_work() as d:
+        t = d.join("t.jinja")
+        pkio.write_text(t, "{% for x in range(3) %}\n{{ x }}!{{ k1 }}\n{% endfor %}\n")
+        pkunit.pkeq(None, pkjinja.render_file(t, {"k1": "v1"}, "out", stream=True))
+        pkunit.pkeq(
+            pkjinja.render_file(t, {"k1": "v1"}),
+            pkio.read_text("out"),
+        )
+        with pkunit.pkexcept("undefined"):
+            pkjinja.render_file(t, {}, "out", strict_undefined=True, stream=True)
+        pkunit.pkeq("0!v1\n1!v1\n2!v1\n", pkio.read_text("out"))
+        pkunit.pkeq(["out", "t.jinja"], sorted(x.basename for x in d.listdir()))
@@ -32,3 +32,31 @@ def test_filename():
     assert pkresource.filename(
         "somefile", t1.somefile
     ), "Given any object, should fine resource in root package of that object"
+
+
+def test_glob_paths():
+    import glob
+    from pykern import pkunit, pkresource, pkio
+
+    def _glob(pattern):
+        return sorted(str(p) for p in pkresource.glob_paths(pattern, pkresource))
+
+    d = pkresource.filename("projex", pkresource)
+    for p in ("*", "projex/*", "projex/*/*.jinja", "nosuchdir/*", "test.yml"):
+        pkunit.pkeq(
+            sorted(glob.glob(pkio.py_path(d).dirpath().join(p).strpath)),
+            _glob(p),
+        )
+    with pkunit.save_chdir_work() as w:
+        pkio.mkdir_parent("package_data")
+        pkio.write_text(w.join("package_data", "x1.txt"), "x")
+        i = pkresource._PackageIndex("pykern")
+        i._root = str(w.join("package_data"))
+        pkunit.pkok(i.filename("x1.txt"), "x1.txt not found")
+        pkio.write_text(w.join("package_data", "x2.txt"), "x")
+        if not pkresource._is_dev_mode():
+            pkunit.pkeq(None, i.filename("x2.txt"))
+            i._dirs.clear()
+        pkunit.pkok(i.filename("x2.txt"), "x2.txt not found after invalidation")
+    pkresource.clear_index()
+    pkunit.pkeq({}, pkresource._index)
@@ -17,3 +17,42 @@ def test_run_path_as_module():
     assert (
         m.func1() == sys.modules
     ), "When imported, should be able to call function within module"
+
+
+def test_code_cache():
+    from pykern import pkunit, pkio
+
+    with pkunit.save_chdir_work() as d:
+        pkrunpy = _code_cache_module(d, "timestamp")
+        f = d.join("f2.py")
+        pkio.write_text(f, "x = 1\n")
+        pkunit.pkeq(1, pkrunpy.run_path_as_module(f).x)
+        c = pkrunpy._memo[(str(f), str(f))][1]
+        pkunit.pkeq(1, pkrunpy.run_path_as_module(f).x)
+        pkunit.pkok(c is pkrunpy._memo[(str(f), str(f))][1], "expecting memoized code")
+        pkunit.pkeq(1, len(d.join("cache").listdir()))
+        pkrunpy.clear_cache()
+        pkunit.pkeq(1, pkrunpy.run_path_as_module(f).x)
+        pkio.write_text(f, "x = 22\n")
+        pkunit.pkeq(22, pkrunpy.run_path_as_module(f).x)
+        pkrunpy = _code_cache_module(d, "checked_hash")
+        pkunit.pkeq(22, pkrunpy.run_path_as_module(f).x)
+        pkrunpy.clear_cache()
+        pkunit.pkeq(22, pkrunpy.run_path_as_module(f).x)
+        pkio.write_text(f, "x = 33\n")
+        pkunit.pkeq(33, pkrunpy.run_path_as_module(f).x)
+
+
+def _code_cache_module(work_dir, check):
+    from pykern import pkconfig
+
+    pkconfig.reset_state_for_testing(
+        dict(
+            PYKERN_PKRUNPY_CODE_CACHE_CHECK=check,
+            PYKERN_PKRUNPY_CODE_CACHE_DIR=str(work_dir.join("cache")),
+        ),
+    )
+    from pykern import pkrunpy
+
+    pkrunpy.clear_cache()
+    return pkrunpy
@@ -0,0 +1,65 @@
+"""test for :mod:`pykern.quest`
+
+:copyright: Copyright (c) 2026 RadiaSoft LLC.  All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+
+def test_lazy_attrs():
+    from pykern import pkunit, quest
+    from pykern.pkcollections import PKDict
+
+    log = []
+
+    class _Attr(quest.Attr):
+        def __init__(self, qcall, **kwargs):
+            log.append(f"init {self.ATTR_KEY}")
+            super().__init__(qcall, **kwargs)
+
+        def quest_end(self, qcall, in_error):
+            log.append(f"end {self.ATTR_KEY} in_error={in_error}")
+
+        def quest_start(self, qcall):
+            log.append(f"start {self.ATTR_KEY}")
+
+    class _A(_Attr):
+        ATTR_KEY = "a"
+
+    class _B(_Attr):
+        ATTR_KEY = "b"
+
+        def quest_start(self, qcall):
+            super().quest_start(qcall)
+            # starts a
+            qcall.a.x = 1
+
+    class _Unused(_Attr):
+        ATTR_KEY = "unused"
+
+    with quest.start(quest.API, (_A, _B, _Unused), y=2) as q:
+        pkunit.pkeq([], log)
+        pkunit.pkeq(2, q["b"].y)
+        pkunit.pkeq(1, q.a.x)
+        pkunit.pkok(q.b is q["b"], "attr created twice")
+        with pkunit.pkexcept(AttributeError):
+            q.not_an_attr
+    pkunit.pkeq(
+        [
+            "init b",
+            "start b",
+            "init a",
+            "start a",
+            "end b in_error=False",
+            "end a in_error=False",
+        ],
+        log,
+    )
+    log.clear()
+    with pkunit.pkexcept(RuntimeError):
+        with quest.start(quest.API, (_A, _B)) as q:
+            q.a
+            raise RuntimeError()
+    pkunit.pkeq(["init a", "start a", "end a in_error=True"], log)
+    with pkunit.pkexcept("already added"):
+        with quest.start(quest.API, (_A, _A)):
+            pass